@@ -1,77 +1,220 @@
-from fastapi import FastAPI, Request, HTTPException
+from fastapi import FastAPI, Request, Depends
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import JSONResponse, Response
+import asyncio
+import hashlib
+import logging
+import logging.handlers
 import os
+import queue
+import sqlite3
+import orjson
+from pydantic import ValidationError
 from app.schemas import UserRequest, ChatResponse
 from core.agent import ConversationalAgent
 from services.database_service import DatabaseService
+from services.cache_service import TTLCache
+from services.llm_provider import http_client
 
-app = FastAPI(title="Conversational Banking Agent")
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered with orjson"""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+app = FastAPI(title="Conversational Banking Agent", default_response_class=ORJSONResponse)
+
+# Log records are handed to a queue; a listener thread does the actual writes
+logger = logging.getLogger("hsbc")
+logger.setLevel(logging.INFO)
+logger.propagate = False
+_log_queue = queue.Queue(-1)
+logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+log_listener = logging.handlers.QueueListener(_log_queue, _log_handler)
 
 # Initialize database on startup
 @app.on_event("startup")
 async def startup_event():
     """Initialize database tables on startup"""
-    db_service = DatabaseService()
-    print("✅ Database initialized successfully!")
-    print("📊 Sample data loaded for user: user123 (John Doe)")
+    log_listener.start()
+    with open("frontend.html", "rb") as f:
+        app.state.frontend_html = f.read()
+    app.state.frontend_etag = '"%s"' % hashlib.md5(app.state.frontend_html).hexdigest()
+    app.state.http = http_client
+    app.state.db = DatabaseService()
+    # Warm up so the first request doesn't pay for opening the database file
+    app.state.db.ping()
+    logger.info("Database initialized successfully")
+    logger.info("Sample data loaded for user: user123 (John Doe)")
 
-# Enable CORS for frontend
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close the shared HTTP client and flush pending history rows and log records"""
+    await app.state.http.aclose()
+    agent.context_manager.flush()
+    log_listener.stop()
+
+# Compress larger JSON payloads (user data, transaction lists)
+app.add_middleware(GZipMiddleware, minimum_size=512, compresslevel=5)
+
+# Enable CORS for frontend (comma-separated ALLOWED_ORIGINS; "*" disables credentials)
+ALLOWED_ORIGINS = [
+    origin.strip()
+    for origin in os.getenv("ALLOWED_ORIGINS", "http://localhost:8000,http://127.0.0.1:8000").split(",")
+    if origin.strip()
+]
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_origins=ALLOWED_ORIGINS,
+    allow_credentials="*" not in ALLOWED_ORIGINS,
+    allow_methods=["GET", "POST"],
+    allow_headers=["content-type", "authorization"],
 )
 
 agent = ConversationalAgent()
 
+# Upper bound for a single conversational turn (LLM + database work)
+CHAT_TIMEOUT = float(os.getenv("CHAT_TIMEOUT", 30))
+# Turns allowed in flight at once; further requests are shed with a 503. A plain
+# counter (checked and taken with no await in between) rather than a semaphore, so
+# nothing queues and nothing is bound to the loop current at import
+MAX_INFLIGHT = int(os.getenv("MAX_INFLIGHT", 32))
+chat_inflight = 0
+
+class ServerBusy(Exception):
+    """Raised when a turn is shed because MAX_INFLIGHT turns are already running"""
+
+# Identical (user, session, message) turns arriving together or within a few
+# seconds (retries, double clicks) share one agent run and its response body
+recent_turns = TTLCache(maxsize=4096, ttl=float(os.getenv("CHAT_DEDUP_TTL", 3)))
+
+# Short-lived cache for the debugging data endpoint, which tends to be polled
+user_data_cache = TTLCache(maxsize=1024, ttl=float(os.getenv("USER_DATA_CACHE_TTL", 5)))
+
+# Pre-encoded error bodies. A new Response is built around them per call
+# because middleware appends headers to the response it is given.
+_SERVER_BUSY = b'{"detail":"Server busy, please try again."}'
+_TIMED_OUT = b'{"detail":"Request timed out, please try again."}'
+_DATABASE_BUSY = b'{"detail":"Database busy, please try again."}'
+_INTERNAL_ERROR = b'{"detail":"Internal error, please try again."}'
+
+_HEALTH_OK = b'{"status":"healthy","database":"connected"}'
+_HEALTH_BAD = b'{"status":"unhealthy","database":"unavailable"}'
+# The database check behind /health runs at most once per second
+health_cache = TTLCache(maxsize=1, ttl=1.0)
+
+def _error_response(body: bytes, status_code: int) -> Response:
+    """Wrap a pre-encoded error body in a JSON response"""
+    return Response(body, status_code=status_code, media_type="application/json")
+
+def get_db(request: Request) -> DatabaseService:
+    """Dependency returning the shared DatabaseService created at startup"""
+    return request.app.state.db
+
 @app.get("/")
-async def serve_frontend():
-    """Serve the frontend HTML file"""
-    return FileResponse("frontend.html")
+async def serve_frontend(request: Request):
+    """Serve the frontend HTML file (cached in memory at startup)"""
+    etag = request.app.state.frontend_etag
+    headers = {"etag": etag, "cache-control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(request.app.state.frontend_html, media_type="text/html", headers=headers)
+
+async def _run_turn(user_id: str, session_id: str, message: str) -> str:
+    """Run one conversational turn and return the JSON-encoded ChatResponse"""
+    global chat_inflight
+    if chat_inflight >= MAX_INFLIGHT:
+        raise ServerBusy()
+    chat_inflight += 1
+    try:
+        response_data = await asyncio.wait_for(
+            agent.process_turn(user_id, session_id, message), timeout=CHAT_TIMEOUT
+        )
+    finally:
+        chat_inflight -= 1
+    if not isinstance(response_data, ChatResponse):
+        response_data = ChatResponse.model_validate(response_data)
+    return response_data.model_dump_json()
 
-@app.post("/chat", response_model=ChatResponse)
-async def handle_chat(request: UserRequest):
+# The raw body is parsed and validated in one step by pydantic-core, and the agent
+# already returns validated ChatResponse models, so the route skips FastAPI's
+# body parsing and response_model re-validation.
+@app.post(
+    "/chat",
+    response_model=None,
+    responses={200: {"model": ChatResponse}},
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": UserRequest.model_json_schema()}},
+        }
+    },
+)
+async def handle_chat(request: Request):
     """
     Main endpoint to handle user messages.
     """
-    user_id = request.user_id
-    session_id = request.session_id
-    message = request.message
+    try:
+        chat_request = UserRequest.model_validate_json(await request.body())
+    except ValidationError as e:
+        raise RequestValidationError(e.errors(include_url=False))
+
+    user_id = chat_request.user_id
+    session_id = chat_request.session_id
+    message = chat_request.message
 
-    if not all([user_id, session_id, message]):
-        raise HTTPException(status_code=400, detail="Missing required fields.")
+    turn_key = hashlib.blake2b(
+        f"{user_id}|{session_id}|{message}".encode(), digest_size=16
+    ).digest()
 
     try:
         # The agent handles the entire conversational turn
-        response_data = await agent.process_turn(user_id, session_id, message)
-        return response_data
-    except Exception as e:
-        print(f"Error processing request: {str(e)}")  # For debugging
-        raise HTTPException(status_code=500, detail=f"Error processing request: {str(e)}")
+        body = await recent_turns.get_or_fetch(
+            turn_key, lambda: _run_turn(user_id, session_id, message)
+        )
+        return Response(body, media_type="application/json")
+    except ServerBusy:
+        return _error_response(_SERVER_BUSY, 503)
+    except asyncio.TimeoutError:
+        logger.warning("Chat turn timed out for session %s", session_id)
+        return _error_response(_TIMED_OUT, 503)
+    except sqlite3.OperationalError as e:
+        logger.warning("Database busy: %s", e)
+        return _error_response(_DATABASE_BUSY, 503)
+    except Exception:
+        logger.exception("Error processing request")
+        return _error_response(_INTERNAL_ERROR, 500)
+
+async def _database_reachable(db_service: DatabaseService) -> bool:
+    """Ping the database without blocking the event loop"""
+    try:
+        return await asyncio.to_thread(db_service.ping)
+    except sqlite3.Error as e:
+        logger.warning("Health check failed: %s", e)
+        return False
 
 @app.get("/health")
-async def health_check():
-    return {"status": "healthy", "database": "connected"}
+async def health_check(db_service: DatabaseService = Depends(get_db)):
+    ok = await health_cache.get_or_fetch("database", lambda: _database_reachable(db_service))
+    if ok:
+        return Response(_HEALTH_OK, media_type="application/json")
+    return _error_response(_HEALTH_BAD, 503)
 
 @app.get("/user/{user_id}/data")
-async def get_user_data(user_id: str):
+async def get_user_data(user_id: str, db_service: DatabaseService = Depends(get_db)):
     """Get complete user data from database (for debugging)"""
     try:
-        db_service = DatabaseService()
-        user = db_service.get_user(user_id)
-        cards = db_service.get_user_cards(user_id)
-        loans = db_service.get_user_loans(user_id)
-        transactions = db_service.get_user_transactions(user_id, limit=10)
-        
-        return {
-            "user": user,
-            "cards": cards,
-            "loans": loans,
-            "recent_transactions": transactions
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        return await user_data_cache.get_or_fetch(
+            user_id, lambda: asyncio.to_thread(db_service.get_user_bundle, user_id, 10)
+        )
+    except sqlite3.OperationalError as e:
+        logger.warning("Database busy: %s", e)
+        return _error_response(_DATABASE_BUSY, 503)
+    except Exception:
+        logger.exception("Error fetching user data")
+        return _error_response(_INTERNAL_ERROR, 500)
@@ -1,10 +1,12 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Optional, Dict, Any
 
 class UserRequest(BaseModel):
-    user_id: str
-    session_id: str
-    message: str
+    model_config = ConfigDict(str_strip_whitespace=True, extra="forbid")
+
+    user_id: str = Field(min_length=1, max_length=64, pattern=r"^[A-Za-z0-9_-]+$")
+    session_id: str = Field(min_length=1, max_length=64, pattern=r"^[A-Za-z0-9_-]+$")
+    message: str = Field(min_length=1, max_length=4096)
 
 class ChatResponse(BaseModel):
     response: str
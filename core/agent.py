@@ -1,20 +1,284 @@
 from core.context_manager import ContextManager
 from core.tool_executor import ToolExecutor
-from core.state_manager import StateManager
-from services.llm_provider import get_llm_response, create_enhanced_system_prompt
+from core.state_manager import MultiStepProcess
+from services.llm_provider import get_llm_response, create_enhanced_system_prompt, format_user_context
 from app.schemas import ChatResponse
-import json
+from tools.banking_api import (
+    get_account_balance, get_mini_statement, get_user_cards, get_user_cards_display,
+    get_comprehensive_account_details, card_management, block_card, new_card_type,
+    card_brand_selection, apply_new_card, limit_modification_cards, get_limit_info,
+    modify_credit_limit, apply_for_loan, get_loan_status
+)
+from tools.definitions import TOOL_DEFINITIONS
+from services.cache_service import TTLCache
 import asyncio
+import logging
 import re
-from typing import Dict, Any
+import orjson
+from typing import Dict, Any, Mapping, Optional, Tuple
+from collections import deque
 from datetime import datetime
+from itertools import islice
+from types import MappingProxyType
+
+logger = logging.getLogger("hsbc.agent")
+
+def _phrase_pattern(*phrases: str) -> "re.Pattern[str]":
+    """Compile phrases into one alternation that matches any of them as a substring"""
+    # A phrase containing another listed phrase can never change the result, so drop it
+    kept = [p for p in phrases if not any(other != p and other in p for other in phrases)]
+    return re.compile("|".join(re.escape(phrase) for phrase in kept))
+
+# Intent phrases for direct routing in process_turn (substring matches on the lowercased message)
+_ACCOUNT_DETAILS_RE = _phrase_pattern(
+    'account details', 'account information', 'complete account', 'full account', 'account overview',
+    'my account details', 'show account details'
+)
+_BALANCE_RE = _phrase_pattern(
+    'balance', 'account balance', 'my balance', 'show balance', "what's my balance", "whats my balance"
+)
+_TRANSACTIONS_RE = _phrase_pattern(
+    'transactions', 'recent transactions', 'mini statement', 'statement', 'transaction history'
+)
+_CARD_MANAGEMENT_RE = _phrase_pattern('card management', 'manage cards', 'card services')
+_NEW_CARD_RE = _phrase_pattern('apply for new card', 'new card application', 'apply new card', 'get new card')
+_BLOCK_CARD_RE = _phrase_pattern('block card', 'block my card')
+_CARD_LIST_RE = _phrase_pattern('my cards', 'show cards', 'list cards')
+_LOAN_LISTING_RE = _phrase_pattern(
+    'list loans', 'list all loans', 'show loans', 'show all loans', 'my loans',
+    'list the loans', 'show the loans', 'loans i have applied', 'loan applications',
+    'applied for loans', 'show my loan applications', 'list my loan applications',
+    'what loans do i have', 'all my loans', 'existing loans'
+)
+_LOAN_LISTING_EXCLUDE_RE = _phrase_pattern('apply', 'new loan', 'apply for')
+# Union of every direct-route phrase: one scan tells whether any route can match at all
+_DIRECT_INTENT_RE = re.compile("|".join(pattern.pattern for pattern in (
+    _ACCOUNT_DETAILS_RE, _BALANCE_RE, _TRANSACTIONS_RE, _CARD_MANAGEMENT_RE, _NEW_CARD_RE,
+    _BLOCK_CARD_RE, _CARD_LIST_RE, _LOAN_LISTING_RE
+)))
+_LOAN_QUERY_RE = _phrase_pattern(
+    'loan', 'apply for loan', 'new loan', 'loan application', 'borrow money', 'need money', 'apply loan'
+)
+
+# Selection and loan-flow keywords (substring matches on the lowercased message)
+_CREDIT_CARD_OPTION_RE = _phrase_pattern('credit_card', 'credit', 'option 1')
+_DEBIT_CARD_OPTION_RE = _phrase_pattern('debit_card', 'debit', 'option 2')
+_VISA_OPTION_RE = _phrase_pattern('visa', 'option 1')
+_MASTERCARD_OPTION_RE = _phrase_pattern('mastercard', 'option 2')
+_RUPAY_OPTION_RE = _phrase_pattern('rupay', 'option 3')
+_BLOCK_CARD_OPTION_RE = _phrase_pattern('block_card', 'block card', 'option 1')
+_NEW_CARD_OPTION_RE = _phrase_pattern('apply_new_card', 'new card', 'apply', 'option 2')
+_MODIFY_LIMIT_OPTION_RE = _phrase_pattern('modify_limit', 'limit', 'credit limit', 'option 3')
+_LOAN_RESUME_RE = _phrase_pattern('apply new loan', 'new loan', 'apply loan', 'continue loan', 'resume loan')
+_START_NEW_RE = _phrase_pattern('start new', 'new', 'fresh', 'different')
+_NEW_LOAN_RE = _phrase_pattern(
+    'new loan', 'apply for new loan', 'another loan', 'different loan', 'start over', 'fresh loan', 'apply loan'
+)
+
+# Loan purpose by keyword; the first listed keyword present in the message wins
+_PURPOSE_KEYWORDS = MappingProxyType({
+    'home': 'Home Improvement',
+    'house': 'Home Improvement',
+    'renovation': 'Home Renovation',
+    'car': 'Auto Purchase',
+    'vehicle': 'Auto Purchase',
+    'auto': 'Auto Purchase',
+    'debt': 'Debt Consolidation',
+    'consolidation': 'Debt Consolidation',
+    'medical': 'Medical Expenses',
+    'health': 'Medical Expenses',
+    'education': 'Education',
+    'school': 'Education',
+    'college': 'Education',
+    'business': 'Business',
+    'wedding': 'Wedding',
+    'marriage': 'Wedding',
+    'vacation': 'Vacation',
+    'travel': 'Vacation',
+    'personal': 'Personal',
+    'emergency': 'Emergency Fund'
+})
+_WORD_RE = re.compile(r'[a-z]+')
+# Banking topics by keyword (substring matches), used to spot topic changes
+_TOPIC_PATTERNS = MappingProxyType({
+    'loan': _phrase_pattern('loan', 'borrow', 'credit', 'mortgage', 'financing'),
+    'card': _phrase_pattern('card', 'debit', 'credit', 'block', 'lost', 'stolen'),
+    'account': _phrase_pattern('balance', 'statement', 'transaction', 'account', 'deposit'),
+    'transfer': _phrase_pattern('transfer', 'send', 'payment', 'wire'),
+    'information': _phrase_pattern('rate', 'fee', 'policy', 'information', 'help')
+})
+# Banking API statuses that carry a message to show the user
+_LOAN_REPLY_STATUSES = frozenset({'info', 'success'})
+
+# A bare amount reply such as "5000", "$5,000" or "5000.00"
+_NUM_RE = re.compile(r'^\$?[0-9][0-9,]*(?:\.[0-9]{2})?$')
+# The first amount anywhere in a message, e.g. the 5000 in "I need $5,000"
+_AMOUNT_RE = re.compile(r'\$?([0-9][0-9,]*(?:\.[0-9]{2})?)')
+# An amount following an income phrase, e.g. "I earn 60000"
+_INCOME_RE = re.compile(r'(?:income|earn|salary|make).*?\$?([0-9][0-9,]*(?:\.[0-9]{2})?)')
+# A card option id such as "card_002" in a selection message
+_CARD_RE = re.compile(r'card_(\d+)')
+
+# Shared read-only default for optional nested state lookups
+_EMPTY: Mapping[str, Any] = MappingProxyType({})
+
+# Tools that change account data and so make cached user context stale
+_WRITE_TOOLS = frozenset({'block_card', 'apply_for_loan'})
+
+# Direct-route reply templates, filled with str.format_map from the banking API results
+_BALANCE_TMPL = """Hi {account_holder}! Here's your account information:
+
+💰 **Current Balance**: ${current_balance:,.2f}
+💳 **Available Balance**: ${available_balance:,.2f}
+⏳ **Pending Transactions**: ${pending_transactions:,.2f}
+
+📊 **Account Details**:
+• Account Type: {account_type}
+• Account Number: {account_number}
+• Last Updated: {last_updated}
+
+💳 **Credit Cards Summary**:
+• Total Credit Limit: ${total_limit:,.2f}
+• Available Credit: ${total_available:,.2f}
+• Credit Utilization: {utilization_rate}
+
+"""
+_TRANSACTION_LINE_TMPL = "• {date} - {description}: ${amount:,.2f} ({direction})"
+_TRANSACTIONS_TMPL = """Hi {account_holder}! Here are your recent transactions:
+
+📋 **Recent Transactions:**
+{transactions_text}
+
+📊 **Summary** ({statement_period}):
+• Total Transactions: {total_transactions}
+• Total Debits: ${total_debits:,.2f}
+• Total Credits: ${total_credits:,.2f}
+• Largest Transaction: ${largest_transaction:,.2f}
+
+💰 **Current Balance**: ${current_balance:,.2f}
+
+"""
+# Instructions for the first LLM call of a turn
+_PROMPT_INSTRUCTIONS = """
+INSTRUCTIONS:
+1. Analyze the user's intent considering full conversation context
+2. Handle context switches gracefully - acknowledge topic changes
+3. For ambiguous requests, ask intelligent clarifying questions
+4. Use tools when real-time data or actions are needed
+5. Maintain awareness of suspended tasks and offer to resume them
+6. Provide personalized responses based on user profile"""
+# Fixed text, so it is kept in the system prompt where the provider can cache it as part of the prefix
+_TURN_SYSTEM_PROMPT = create_enhanced_system_prompt() + "\n" + _PROMPT_INSTRUCTIONS
+# Prompts for resuming a suspended loan application, filled from its collected data
+_STEP_PURPOSE_TMPL = "Great! Continuing with your loan application for ${amount:,.2f}.\n\n**Step 2: Loan Purpose**\nWhat will you use this loan for? (e.g., Home Improvement, Debt Consolidation, Auto Purchase, Medical Expenses, etc.)"
+_STEP_INCOME_TMPL = "Perfect! Loan amount: ${amount:,.2f} for {purpose}.\n\n**Step 3: Annual Income**\nWhat is your annual gross income? This helps us determine your loan eligibility and interest rate."
+_RESUME_INVALID_CHOICE = "Please choose either:\n• **'continue'** - to resume your previous loan application\n• **'start new'** - to begin a fresh loan application"
+
+# Fixed replies, built once and returned as-is (responses are only serialized, never edited)
+_ERR_CARD_MISSING = ChatResponse(response="Error: Card information not found. Please start the process again.")
+_ERR_INVALID_AMOUNT = ChatResponse(response="Please enter a valid numeric amount for the credit limit. For example: 20000 or $20,000")
+_ERR_MISSING_AMOUNT = ChatResponse(response="Please specify the new credit limit amount. For example: 20000 or $20,000")
+_ERR_UNRECOGNIZED_PROCESS = ChatResponse(response="Process not recognized. Please try again.")
+# Replies when the LLM call fails, by loan step or by what the message mentions
+_LOAN_STEP_FALLBACKS = MappingProxyType({
+    'amount': ChatResponse(response="I'm having trouble processing your loan amount. Could you please specify the loan amount you need? For example: '$15,000' or 'I need $15000'"),
+    'purpose': ChatResponse(response="I need to know the purpose of your loan. What will you use this loan for? (e.g., home renovation, car purchase, debt consolidation)"),
+    'income': ChatResponse(response="To complete your loan application, I need your annual income information. What is your yearly gross income?")
+})
+_FALLBACK_LOAN_RESTART = ChatResponse(response="I'm having trouble with your loan application. Let me help you start over. What loan amount do you need?")
+_FALLBACK_BALANCE = ChatResponse(response="I'd be happy to help you check your account balance. Let me retrieve that information for you.")
+_FALLBACK_CARDS = ChatResponse(response="I can help you with your card services. What would you like to do with your cards today?")
+_FALLBACK_LOANS = ChatResponse(response="I'm here to assist with your loan inquiries. What specific information about loans can I help you with?")
+_FALLBACK_GENERAL = ChatResponse(response="I'm here to help with your banking needs. You can ask me about your account balance, cards, transactions, or loan applications. What would you like to know?")
+# Message keywords for the fallbacks above, checked in this order
+_FALLBACK_BY_KEYWORD = MappingProxyType({
+    'balance': _FALLBACK_BALANCE,
+    'card': _FALLBACK_CARDS,
+    'loan': _FALLBACK_LOANS
+})
+_FALLBACK_KEYWORD_RE = re.compile('|'.join(_FALLBACK_BY_KEYWORD))
+
+def _to_amount(match: Optional["re.Match[str]"]) -> Optional[float]:
+    """Float value of a matched amount group, or None"""
+    if match:
+        try:
+            return float(match.group(1).replace(',', ''))
+        except ValueError:
+            pass
+    return None
+
+def _parse_loan_fields(message: str, message_lower: str) -> Tuple[Optional[float], Optional[float], Optional[str]]:
+    """Pull (amount, income, purpose) out of a loan-flow message; each is None when absent"""
+    amount_match = _AMOUNT_RE.search(message)
+    amount = _to_amount(amount_match)
+    # The income pattern ends in the same digits group, so it can't match where the amount scan found nothing
+    income = _to_amount(_INCOME_RE.search(message_lower)) if amount_match else None
+    
+    # Purpose keywords match whole words, so "card" does not count as "car"
+    words = set(_WORD_RE.findall(message_lower))
+    words.update([word[:-1] for word in words if word.endswith('s')])  # "cars", "weddings"
+    purpose = next((purpose for keyword, purpose in _PURPOSE_KEYWORDS.items() if keyword in words), None)
+    
+    return amount, income, purpose
+
+# Longest tool result (in characters) embedded in the follow-up LLM prompt
+_TOOL_RESULT_MAX_CHARS = 4000
+
+def _compact_json(obj: Any, max_chars: int = _TOOL_RESULT_MAX_CHARS) -> str:
+    """Whitespace-free JSON for a prompt, cut to max_chars"""
+    text = orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+    if len(text) > max_chars:
+        text = text[:max_chars] + "...<truncated>"
+    return text
+
+def _multi_step_process(result: Mapping[str, Any], **extra: Any) -> MultiStepProcess:
+    """Multi-step process entry for session state from a banking-layer step result"""
+    process: MultiStepProcess = {
+        'type': result.get('process_type'),
+        'current_step': result.get('current_step'),
+        'collected_data': result.get('collected_data', {}),
+    }
+    process.update(extra)
+    return process
 
 class ConversationalAgent:
     def __init__(self):
         self.context_manager = ContextManager()
         self.tool_executor = ToolExecutor()
-        self.state_manager = StateManager()
+        self.state_manager = self.context_manager.state_manager  # one shared connection
         self.conversation_memory = {}  # Enhanced memory for context switching
+        self._user_context_cache = TTLCache(maxsize=1024, ttl=60)
+        self._user_profile_cache = TTLCache(maxsize=1024, ttl=300)
+        # Direct intent routes checked in order: (pattern, exclude pattern or None, handler)
+        self._routes = (
+            # Comprehensive account details - BEFORE balance queries
+            (_ACCOUNT_DETAILS_RE, None, self._handle_account_details_query),
+            (_BALANCE_RE, None, self._handle_balance_query),
+            (_TRANSACTIONS_RE, None, self._handle_transaction_query),
+            # Card management (shows menu of actions)
+            (_CARD_MANAGEMENT_RE, None, self._handle_card_management_query),
+            # New card application - BEFORE loan detection
+            (_NEW_CARD_RE, None, self._handle_new_card_application),
+            # Direct card blocking (shows list of cards); card management phrases are routed above
+            (_BLOCK_CARD_RE, None, self._handle_direct_card_blocking),
+            # General card queries (shows list of cards)
+            (_CARD_LIST_RE, None, self._handle_card_list_query),
+            # Loan listing - BEFORE loan application queries
+            (_LOAN_LISTING_RE, _LOAN_LISTING_EXCLUDE_RE, self._handle_loan_listing_query),
+        )
+        # Pending-action handlers by process_type; anything else is treated as card blocking
+        self._pending_dispatch = {
+            'card_management': self._handle_card_management_selection,
+            'new_card_application': self._handle_new_card_application_selection,
+            'card_application': self._handle_card_application_selection,  # Legacy support
+            'limit_modification': self._handle_limit_modification_selection,
+            'card_blocking': self._handle_card_blocking_selection,
+        }
+        # Multi-step process handlers by process type
+        self._process_dispatch = {
+            'limit_modification': self._handle_limit_modification_process,
+            'loan_application': self._handle_loan_process,
+        }
 
     async def process_turn(self, user_id: str, session_id: str, message: str) -> ChatResponse:
         """Process a complete conversational turn with enhanced context awareness"""
@@ -23,57 +287,28 @@ class ConversationalAgent:
         message_lower = message.lower()
         
         # Get current state to check for ongoing processes
-        current_state = self.state_manager.get_state(session_id) or {}
-        loan_process = current_state.get('multi_step_process', {})
-        pending_action = current_state.get('pending_action', {})
-        #Handle comprehensive account details queries - BEFORE balance queries
-        if any(phrase in message_lower for phrase in ['account details', 'account information', 'complete account', 'full account', 'account overview', 'my account details', 'show account details']):
-            return await self._handle_account_details_query(user_id, session_id, message)
-        # Handle balance queries directly
-        if any(phrase in message_lower for phrase in ['balance', 'account balance', 'my balance', 'show balance', "what's my balance", "whats my balance"]):
-            return await self._handle_balance_query(user_id, session_id, message)
-        
-        # Handle transaction queries directly
-        if any(phrase in message_lower for phrase in ['transactions', 'recent transactions', 'mini statement', 'statement', 'transaction history']):
-            return await self._handle_transaction_query(user_id, session_id, message)
-        
-        # Handle card management queries (shows menu of actions)
-        if any(phrase in message_lower for phrase in ['card management', 'manage cards', 'card services']):
-            return await self._handle_card_management_query(user_id, session_id, message)
-        
-        # Handle NEW CARD APPLICATION queries - IMPORTANT: This should come BEFORE loan detection
-        if any(phrase in message_lower for phrase in ['apply for new card', 'new card application', 'apply new card', 'get new card']):
-            return await self._handle_new_card_application(user_id, session_id, message)
-        
-        # Handle direct card blocking queries (shows list of cards)
-        if any(phrase in message_lower for phrase in ['block card', 'block my card']) and not any(phrase in message_lower for phrase in ['card management', 'manage cards']):
-            return await self._handle_direct_card_blocking(user_id, session_id, message)
-        
-        # Handle general card queries (shows list of cards)
-        if any(phrase in message_lower for phrase in ['my cards', 'show cards', 'list cards']):
-            return await self._handle_card_list_query(user_id, session_id, message)
-        
-        # Handle loan listing queries BEFORE loan application queries
-        if any(phrase in message_lower for phrase in [
-            'list loans', 'list all loans', 'show loans', 'show all loans', 'my loans', 
-            'list the loans', 'show the loans', 'loans i have applied', 'loan applications', 
-            'applied for loans', 'show my loan applications', 'list my loan applications',
-            'what loans do i have', 'all my loans', 'existing loans'
-        ]) and not any(phrase in message_lower for phrase in ['apply', 'new loan', 'apply for']):
-            return await self._handle_loan_listing_query(user_id, session_id, message)
+        current_state = await asyncio.to_thread(self.state_manager.get_state, session_id) or {}
+        loan_process = current_state.get('multi_step_process', _EMPTY)
+        pending_action = current_state.get('pending_action', _EMPTY)
+
+        # Handle direct intents (account, balance, transactions, cards, loan listing)
+        if _DIRECT_INTENT_RE.search(message_lower):
+            for pattern, exclude, handler in self._routes:
+                if pattern.search(message_lower) and not (exclude and exclude.search(message_lower)):
+                    return await handler(user_id, session_id, message, current_state)
 
         # Handle loan process with context switching support - AFTER loan listing detection
         is_loan_process_active = loan_process.get('type') == 'loan_application'
-        is_loan_query = any(phrase in message_lower for phrase in ['loan', 'apply for loan', 'new loan', 'loan application', 'borrow money', 'need money', 'apply loan'])
-        is_numerical_response = re.match(r'^\$?[0-9,]+(?:\.[0-9]{2})?$', message.strip())
+        is_loan_query = _LOAN_QUERY_RE.search(message_lower) is not None
+        is_numerical_response = _NUM_RE.match(message.strip())
 
         if is_loan_process_active or is_loan_query or (is_loan_process_active and is_numerical_response):
-            return await self._handle_loan_process(user_id, session_id, message, loan_process)
+            return await self._handle_loan_process(user_id, session_id, message, loan_process, message_lower)
 
         
         # Handle pending actions (card blocking, limit modifications, etc.)
         if pending_action:
-            return await self._handle_pending_actions(user_id, session_id, message, pending_action)
+            return await self._handle_pending_actions(user_id, session_id, message, pending_action, message_lower)
         
         # Handle multi-step processes (card applications, limit modifications)
         if current_state.get('multi_step_process'):
@@ -84,25 +319,30 @@ class ConversationalAgent:
 
         
         # Detect context switches and intent changes
-        await self._analyze_context_switch(session_id, message)
+        await self._analyze_context_switch(session_id, message, current_state, message_lower)
         
         # Enhanced prompt preparation with conversation intelligence
         try:
-            prompt, tool_definitions = await self._prepare_intelligent_prompt(user_id, session_id, message)
+            (prompt, recall, tool_definitions), user_context = await asyncio.gather(
+                self._prepare_intelligent_prompt(user_id, session_id, message, current_state),
+                self._get_user_context(user_id)
+            )
             
-            # Create enhanced system prompt
-            user_context = await self._get_user_context(user_id)
-            system_prompt = create_enhanced_system_prompt(user_context)
+            # Static system prompts; user details and recall travel in the context message
+            system_prompt = create_enhanced_system_prompt()
+            user_block = format_user_context(user_context)
+            context = "\n\n".join(part for part in (user_block, recall) if part)
             
             # First LLM call with enhanced context
-            llm_decision = await get_llm_response(prompt, tools=tool_definitions, system_prompt=system_prompt)
+            llm_decision = await get_llm_response(prompt, tools=tool_definitions, system_prompt=_TURN_SYSTEM_PROMPT,
+                                                  context=context)
             
             response_data = ChatResponse(response="")
             
             if llm_decision.has_tool_call:
                 # Execute tool with context awareness
                 tool_result = await self._execute_tool_with_context(
-                    user_id, session_id, llm_decision.tool_call.name, llm_decision.tool_call.arguments
+                    user_id, session_id, llm_decision.tool_call.name, llm_decision.tool_call.arguments, current_state
                 )
                 
                 # Handle multi-step processes
@@ -113,35 +353,48 @@ class ConversationalAgent:
                 else:
                     # Generate final response with full context
                     final_response = await self._generate_contextual_response(
-                        session_id, llm_decision.tool_call.name, tool_result, message, system_prompt
+                        session_id, llm_decision.tool_call.name, tool_result, message, system_prompt, user_block
                     )
                     response_data.response = final_response
             else:
                 # Direct response with context awareness
                 response_data.response = llm_decision.text
 
-            # Update conversation memory and context
+            # Update conversation memory and context (in-memory work; history rows are written in batches)
             await self._update_conversation_context(session_id, message, response_data.response)
             
             return response_data
             
         except Exception as e:
             # Enhanced fallback for LLM failures
-            return await self._handle_llm_failure(session_id, message, current_state, e)
+            return await self._handle_llm_failure(session_id, message, current_state, e, message_lower)
     
-    async def _handle_card_blocking_selection(self, user_id: str, session_id: str, message: str, pending_action: Dict) -> ChatResponse:
+    def _record_turn(self, session_id: str, user_message: str, ai_response: str):
+        """Append a turn to the conversation history (queued for the batched writer)"""
+        self.context_manager.update_history(session_id, user_message, ai_response)
+
+    async def _handle_card_blocking_selection(self, user_id: str, session_id: str, message: str, pending_action: Dict,
+                                              message_lower: Optional[str] = None) -> ChatResponse:
         """Handle card blocking selection"""
         
+        if message_lower is None:
+            message_lower = message.lower()
+        
         # Extract option ID from message
-        card_match = re.search(r'card_(\d+)', message.lower())
+        card_match = _CARD_RE.search(message_lower)
         if card_match:
             card_id = f"card_{card_match.group(1).zfill(3)}"
             
             # Execute the card blocking
-            from tools.banking_api import block_card
-            block_result = block_card(user_id, card_id)
+            block_result = await asyncio.to_thread(block_card, user_id, card_id)
+            
+            # Clear pending action
+            async with self.state_manager.session(session_id) as current_state:
+                current_state.pop('pending_action', None)
             
             if block_result.get('status') == 'success':
+                self._invalidate_user_context(user_id)
+                next_steps = "\n".join(f"• {step}" for step in block_result['next_steps'])
                 response_text = f"""✅ {block_result['message']}
 
     🔐 **Confirmation Details:**
@@ -150,34 +403,28 @@ class ConversationalAgent:
     • Blocked Date: {block_result['card_details']['blocked_date']}
 
     📋 **Next Steps:**
-    {chr(10).join(['• ' + step for step in block_result['next_steps']])}
+    {next_steps}
 
-    {await self._get_context_switch_message(session_id)}"""
+    {await self._get_context_switch_message(session_id, current_state)}"""
             else:
                 response_text = f"❌ {block_result.get('message', 'Unable to block the card. Please try again.')}"
                 
                 # Add context switch message
-                response_text += f"\n\n{await self._get_context_switch_message(session_id)}"
-            
-            # Clear pending action
-            current_state = self.state_manager.get_state(session_id) or {}
-            if 'pending_action' in current_state:
-                del current_state['pending_action']
-            self.state_manager.update_state(session_id, current_state)
+                response_text += f"\n\n{await self._get_context_switch_message(session_id, current_state)}"
             
             response_data = ChatResponse(response=response_text)
-            self.context_manager.update_history(session_id, message, response_text)
+            self._record_turn(session_id, message, response_text)
             return response_data
         
         return ChatResponse(response="Please select a valid card option.")
 
-    async def _handle_new_card_application(self, user_id: str, session_id: str, message: str) -> ChatResponse:
+    async def _handle_new_card_application(self, user_id: str, session_id: str, message: str,
+                                           current_state: Optional[Dict] = None) -> ChatResponse:
         """Handle new card application directly"""
         
         try:
-            await self._save_current_process_on_context_switch(session_id, 'new_card_application')
+            await self._save_current_process_on_context_switch(session_id, 'new_card_application', current_state)
             
-            from tools.banking_api import new_card_type
             type_result = new_card_type(user_id)
             
             if type_result.get("requires_selection"):
@@ -188,7 +435,7 @@ class ConversationalAgent:
                 )
                 
                 # Update pending action for new card application
-                self.state_manager.update_state(session_id, {
+                await asyncio.to_thread(self.state_manager.update_state, session_id, {
                     "pending_action": {
                         "tool": "new_card_application",
                         "step": "type_selection",
@@ -200,26 +447,27 @@ class ConversationalAgent:
             
             return ChatResponse(response="Unable to access card application options. Please try again.")
             
-        except Exception as e:
-            print(f"New Card Application Error: {str(e)}")
+        except Exception:
+            logger.exception("New Card Application Error")
             return ChatResponse(response="I'm having trouble processing your card application. Please try again.")
 
-    async def _handle_new_card_application_selection(self, user_id: str, session_id: str, message: str, pending_action: Dict) -> ChatResponse:
+    async def _handle_new_card_application_selection(self, user_id: str, session_id: str, message: str, pending_action: Dict,
+                                                     message_lower: Optional[str] = None) -> ChatResponse:
         """Handle new card application selections"""
         
         current_step = pending_action.get('step')
-        message_lower = message.lower()
+        if message_lower is None:
+            message_lower = message.lower()
         
         if current_step == 'type_selection':
             selected_type = None
-            if any(phrase in message_lower for phrase in ['credit_card', 'credit', 'option 1']):
+            if _CREDIT_CARD_OPTION_RE.search(message_lower):
                 selected_type = 'credit_card'
-            elif any(phrase in message_lower for phrase in ['debit_card', 'debit', 'option 2']):
+            elif _DEBIT_CARD_OPTION_RE.search(message_lower):
                 selected_type = 'debit_card'
             
             if selected_type:
                 # Show brand options
-                from tools.banking_api import card_brand_selection
                 brand_result = card_brand_selection(user_id, selected_type)
                 
                 if brand_result.get("requires_selection"):
@@ -230,7 +478,7 @@ class ConversationalAgent:
                     )
                     
                     # Update pending action
-                    self.state_manager.update_state(session_id, {
+                    await asyncio.to_thread(self.state_manager.update_state, session_id, {
                         "pending_action": {
                             "tool": "new_card_application",
                             "step": "brand_selection",
@@ -243,127 +491,100 @@ class ConversationalAgent:
                     
         elif current_step == 'brand_selection':
             selected_brand = None
-            if any(phrase in message_lower for phrase in ['visa', 'option 1']):
+            if _VISA_OPTION_RE.search(message_lower):
                 selected_brand = 'visa'
-            elif any(phrase in message_lower for phrase in ['mastercard', 'option 2']):
+            elif _MASTERCARD_OPTION_RE.search(message_lower):
                 selected_brand = 'mastercard'
-            elif any(phrase in message_lower for phrase in ['rupay', 'option 3']):
+            elif _RUPAY_OPTION_RE.search(message_lower):
                 selected_brand = 'rupay'
             
             if selected_brand:
                 # Apply for the card and create actual card
                 card_type = pending_action.get('card_type')
-                from tools.banking_api import apply_new_card
-                application_result = apply_new_card(user_id, card_type, selected_brand)
+                application_result = await asyncio.to_thread(apply_new_card, user_id, card_type, selected_brand)
+                self._invalidate_user_context(user_id)
+                
+                # Clear pending action
+                async with self.state_manager.session(session_id) as current_state:
+                    current_state.pop('pending_action', None)
                 
                 response_text = application_result.get('message', 'Card application processed successfully!')
                 
                 # Add context switch message if needed
-                response_text += f"\n\n{await self._get_context_switch_message(session_id)}"
+                response_text += f"\n\n{await self._get_context_switch_message(session_id, current_state)}"
                 
                 response_data = ChatResponse(response=response_text)
-                
-                # Clear pending action
-                current_state = self.state_manager.get_state(session_id) or {}
-                if 'pending_action' in current_state:
-                    del current_state['pending_action']
-                self.state_manager.update_state(session_id, current_state)
-                
-                self.context_manager.update_history(session_id, message, response_text)
+                self._record_turn(session_id, message, response_text)
                 return response_data
         
         return ChatResponse(response="Please select a valid option.")
 
-    async def _handle_account_details_query(self, user_id: str, session_id: str, message: str) -> ChatResponse:
+    async def _handle_account_details_query(self, user_id: str, session_id: str, message: str,
+                                            current_state: Optional[Dict] = None) -> ChatResponse:
         """Handle comprehensive account details query - shows everything"""
         
         try:
-            await self._save_current_process_on_context_switch(session_id, 'account_details')
+            await self._save_current_process_on_context_switch(session_id, 'account_details', current_state)
             
-            from tools.banking_api import get_comprehensive_account_details
-            account_result = get_comprehensive_account_details(user_id)
+            account_result = await asyncio.to_thread(get_comprehensive_account_details, user_id)
             
             if account_result.get('status') == 'success':
                 response_text = account_result['message']
                 
                 # Add context switch message if needed
-                response_text += f"\n\n{await self._get_context_switch_message(session_id)}"
+                response_text += f"\n\n{await self._get_context_switch_message(session_id, current_state)}"
                 
                 response_data = ChatResponse(response=response_text)
-                self.context_manager.update_history(session_id, message, response_text)
+                self._record_turn(session_id, message, response_text)
                 return response_data
             
             return ChatResponse(response="Unable to retrieve your account details. Please try again.")
             
-        except Exception as e:
-            print(f"Account Details Error: {str(e)}")
+        except Exception:
+            logger.exception("Account Details Error")
             return ChatResponse(response="I'm having trouble accessing your account information right now. Please try again.")
 
-    async def _handle_balance_query(self, user_id: str, session_id: str, message: str) -> ChatResponse:
+    async def _handle_balance_query(self, user_id: str, session_id: str, message: str,
+                                    current_state: Optional[Dict] = None) -> ChatResponse:
         """Handle balance queries with context switching support"""
         
         # Check if we need to save current process before switching
-        await self._save_current_process_on_context_switch(session_id, 'balance')
+        await self._save_current_process_on_context_switch(session_id, 'balance', current_state)
         
-        from tools.banking_api import get_account_balance
-        balance_result = get_account_balance(user_id)
+        balance_result = await asyncio.to_thread(get_account_balance, user_id)
         
         if balance_result.get('status') == 'success':
-            response_text = f"""Hi {balance_result['account_holder']}! Here's your account information:
-
-💰 **Current Balance**: ${balance_result['current_balance']:,.2f}
-💳 **Available Balance**: ${balance_result['available_balance']:,.2f}
-⏳ **Pending Transactions**: ${balance_result['pending_transactions']:,.2f}
-
-📊 **Account Details**:
-• Account Type: {balance_result['account_type']}
-• Account Number: {balance_result['account_number']}
-• Last Updated: {balance_result['last_updated']}
-
-💳 **Credit Cards Summary**:
-• Total Credit Limit: ${balance_result['credit_cards_summary']['total_limit']:,.2f}
-• Available Credit: ${balance_result['credit_cards_summary']['total_available']:,.2f}
-• Credit Utilization: {balance_result['credit_cards_summary']['utilization_rate']}
-
-{await self._get_context_switch_message(session_id)}"""
+            fields = {**balance_result, **balance_result['credit_cards_summary']}
+            response_text = _BALANCE_TMPL.format_map(fields) + await self._get_context_switch_message(session_id, current_state)
             
             response_data = ChatResponse(response=response_text)
-            self.context_manager.update_history(session_id, message, response_text)
+            self._record_turn(session_id, message, response_text)
             return response_data
         
         return ChatResponse(response="Unable to retrieve balance information. Please try again.")
 
-    async def _handle_transaction_query(self, user_id: str, session_id: str, message: str) -> ChatResponse:
+    async def _handle_transaction_query(self, user_id: str, session_id: str, message: str,
+                                        current_state: Optional[Dict] = None) -> ChatResponse:
         """Handle transaction queries with context switching support"""
         
-        await self._save_current_process_on_context_switch(session_id, 'transactions')
+        await self._save_current_process_on_context_switch(session_id, 'transactions', current_state)
         
-        from tools.banking_api import get_mini_statement
-        statement_result = get_mini_statement(user_id)
+        statement_result = await asyncio.to_thread(get_mini_statement, user_id)
         
         if statement_result.get('status') == 'success':
-            transactions_text = "\n".join([
-                f"• {t['date']} - {t['description']}: ${abs(t['amount']):,.2f} ({'Credit' if t['amount'] > 0 else 'Debit'})"
-                for t in statement_result['transactions'][:5]
-            ])
+            transactions_text = "\n".join(
+                _TRANSACTION_LINE_TMPL.format(
+                    date=t['date'], description=t['description'], amount=abs(amount := t['amount']),
+                    direction='Credit' if amount > 0 else 'Debit'
+                )
+                for t in islice(statement_result['transactions'], 5)
+            )
             
-            response_text = f"""Hi {statement_result['account_holder']}! Here are your recent transactions:
-
-📋 **Recent Transactions:**
-{transactions_text}
-
-📊 **Summary** ({statement_result['statement_period']}):
-• Total Transactions: {statement_result['summary']['total_transactions']}
-• Total Debits: ${statement_result['summary']['total_debits']:,.2f}
-• Total Credits: ${statement_result['summary']['total_credits']:,.2f}
-• Largest Transaction: ${statement_result['summary']['largest_transaction']:,.2f}
-
-💰 **Current Balance**: ${statement_result['current_balance']:,.2f}
-
-{await self._get_context_switch_message(session_id)}"""
+            fields = {**statement_result, **statement_result['summary'], 'transactions_text': transactions_text}
+            response_text = _TRANSACTIONS_TMPL.format_map(fields) + await self._get_context_switch_message(session_id, current_state)
             
             response_data = ChatResponse(response=response_text)
-            self.context_manager.update_history(session_id, message, response_text)
+            self._record_turn(session_id, message, response_text)
             return response_data
         
         return ChatResponse(response="Unable to retrieve transaction information. Please try again.")
@@ -371,83 +592,72 @@ class ConversationalAgent:
         """Clean up completed processes from state"""
         
         try:
-            current_state = self.state_manager.get_state(session_id) or {}
-            
-            # Clean up completed multi-step processes
-            multi_step = current_state.get('multi_step_process', {})
-            if multi_step.get('process_complete') or multi_step.get('status') == 'complete':
-                del current_state['multi_step_process']
-            
-            # Clean up old pending actions
-            pending_action = current_state.get('pending_action', {})
-            if pending_action.get('completed'):
-                del current_state['pending_action']
-            
-            # Clean up old context switches
-            if current_state.get('context_switched'):
-                current_state['context_switched'] = False
-            
-            # Update the cleaned state
-            self.state_manager.update_state(session_id, current_state)
-            
-        except Exception as e:
-            print(f"State cleanup error: {str(e)}")
-    async def _handle_card_management_query(self, user_id: str, session_id: str, message: str) -> ChatResponse:
+            async with self.state_manager.session(session_id) as current_state:
+                # Clean up completed multi-step processes
+                multi_step = current_state.get('multi_step_process')
+                if multi_step and (multi_step.get('process_complete') or multi_step.get('status') == 'complete'):
+                    current_state.pop('multi_step_process', None)
+                
+                # Clean up old pending actions
+                pending_action = current_state.get('pending_action')
+                if pending_action and pending_action.get('completed'):
+                    current_state.pop('pending_action', None)
+                
+                # Clean up old context switches
+                if current_state.get('context_switched'):
+                    current_state['context_switched'] = False
+            
+        except Exception:
+            logger.exception("State cleanup error")
+    async def _handle_card_management_query(self, user_id: str, session_id: str, message: str,
+                                            current_state: Optional[Dict] = None) -> ChatResponse:
         """Handle card management queries - shows menu of actions"""
         
         try:
-            # Clean up any residual state first
-            current_state = self.state_manager.get_state(session_id) or {}
-            
-            # Clear any completed processes
-            if current_state.get('multi_step_process', {}).get('process_complete'):
-                del current_state['multi_step_process']
-                self.state_manager.update_state(session_id, current_state)
-            
-            await self._save_current_process_on_context_switch(session_id, 'card_management')
-            
-            from tools.banking_api import card_management
-            management_result = card_management(user_id)
+            async with self.state_manager.session(session_id, current_state) as current_state:
+                # Clear any completed processes
+                multi_step = current_state.get('multi_step_process')
+                if multi_step and multi_step.get('process_complete'):
+                    current_state.pop('multi_step_process', None)
+                
+                self._suspend_active_process(current_state, 'card_management')
+                
+                management_result = await asyncio.to_thread(card_management, user_id)
+                
+                if management_result.get("requires_selection"):
+                    # Save new pending action state
+                    current_state["pending_action"] = {
+                        "tool": "card_management",
+                        "args": {},
+                        "options": management_result["options"],
+                        "process_type": "card_management"
+                    }
             
             if management_result.get("requires_selection"):
-                response_data = ChatResponse(
+                return ChatResponse(
                     response=management_result["message"],
                     requires_selection=True,
                     options=management_result["options"]
                 )
-                
-                # Clear any existing pending actions first
-                current_state = self.state_manager.get_state(session_id) or {}
-                
-                # Save new pending action state
-                current_state["pending_action"] = {
-                    "tool": "card_management",
-                    "args": {},
-                    "options": management_result["options"],
-                    "process_type": "card_management"
-                }
-                
-                self.state_manager.update_state(session_id, current_state)
-                return response_data
             
             return ChatResponse(response="Unable to access card management options. Please try again.")
             
-        except Exception as e:
-            print(f"Card Management Error: {str(e)}")  # For debugging
+        except Exception:
+            logger.exception("Card Management Error")
             
             # Fallback response
             return ChatResponse(
                 response="I'm having trouble accessing your card management options right now. Let me help you directly - would you like to:\n\n1. Block a card\n2. Apply for a new card\n3. Modify credit limits\n\nPlease tell me which option you'd prefer."
             )
 
-    async def _handle_direct_card_blocking(self, user_id: str, session_id: str, message: str) -> ChatResponse:
+    async def _handle_direct_card_blocking(self, user_id: str, session_id: str, message: str,
+                                           current_state: Optional[Dict] = None) -> ChatResponse:
         """Handle direct card blocking queries - shows list of cards to block"""
         
         try:
-            await self._save_current_process_on_context_switch(session_id, 'card_blocking')
+            await self._save_current_process_on_context_switch(session_id, 'card_blocking', current_state)
             
-            from tools.banking_api import get_user_cards
-            cards_result = get_user_cards(user_id)
+            cards_result = await asyncio.to_thread(get_user_cards, user_id)
             
             if isinstance(cards_result, dict) and cards_result.get("requires_selection"):
                 # Modify the message to be specific about blocking
@@ -460,7 +670,7 @@ class ConversationalAgent:
                 )
                 
                 # Save pending action state for card blocking
-                self.state_manager.update_state(session_id, {
+                await asyncio.to_thread(self.state_manager.update_state, session_id, {
                     "pending_action": {
                         "tool": "block_card",
                         "args": {},
@@ -472,18 +682,18 @@ class ConversationalAgent:
             
             return ChatResponse(response="Unable to retrieve your cards. Please try again.")
             
-        except Exception as e:
-            print(f"Card Blocking Error: {str(e)}")
+        except Exception:
+            logger.exception("Card Blocking Error")
             return ChatResponse(response="I'm having trouble accessing your cards right now. Please try again or contact support.")
 
-    async def _handle_card_list_query(self, user_id: str, session_id: str, message: str) -> ChatResponse:
+    async def _handle_card_list_query(self, user_id: str, session_id: str, message: str,
+                                      current_state: Optional[Dict] = None) -> ChatResponse:
         """Handle general card list queries - shows cards for general viewing"""
         
         try:
-            await self._save_current_process_on_context_switch(session_id, 'cards')
+            await self._save_current_process_on_context_switch(session_id, 'cards', current_state)
             
-            from tools.banking_api import get_user_cards_display
-            cards_result = get_user_cards_display(user_id)
+            cards_result = await asyncio.to_thread(get_user_cards_display, user_id)
             
             if cards_result.get('status') == 'success':
                 cards = cards_result['cards']
@@ -507,86 +717,39 @@ class ConversationalAgent:
     • Apply for a new card  
     • Modify credit limits
 
-    {await self._get_context_switch_message(session_id)}"""
+    {await self._get_context_switch_message(session_id, current_state)}"""
                 
                 response_data = ChatResponse(response=response_text)
-                self.context_manager.update_history(session_id, message, response_text)
+                self._record_turn(session_id, message, response_text)
                 return response_data
             
             return ChatResponse(response="Unable to retrieve your cards. Please try again.")
             
-        except Exception as e:
-            print(f"Card List Error: {str(e)}")
+        except Exception:
+            logger.exception("Card List Error")
             return ChatResponse(response="I'm having trouble accessing your cards right now. Please try again.")
 
-    async def _handle_card_query(self, user_id: str, session_id: str, message: str) -> ChatResponse:
-        """Handle card management queries with enhanced error handling"""
-        
-        try:
-            # Clean up any residual state first
-            current_state = self.state_manager.get_state(session_id) or {}
-            
-            # Clear any completed processes
-            if current_state.get('multi_step_process', {}).get('process_complete'):
-                del current_state['multi_step_process']
-                self.state_manager.update_state(session_id, current_state)
-            
-            await self._save_current_process_on_context_switch(session_id, 'card_management')
-            
-            from tools.banking_api import card_management
-            management_result = card_management(user_id)
-            
-            if management_result.get("requires_selection"):
-                response_data = ChatResponse(
-                    response=management_result["message"],
-                    requires_selection=True,
-                    options=management_result["options"]
-                )
-                
-                # Clear any existing pending actions first
-                current_state = self.state_manager.get_state(session_id) or {}
-                
-                # Save new pending action state
-                current_state["pending_action"] = {
-                    "tool": "card_management",
-                    "args": {},
-                    "options": management_result["options"],
-                    "process_type": "card_management"
-                }
-                
-                self.state_manager.update_state(session_id, current_state)
-                return response_data
-            
-            return ChatResponse(response="Unable to access card management options. Please try again.")
-            
-        except Exception as e:
-            print(f"Card Management Error: {str(e)}")  # For debugging
-            
-            # Fallback response
-            return ChatResponse(
-                response="I'm having trouble accessing your card management options right now. Let me help you directly - would you like to:\n\n1. Block a card\n2. Apply for a new card\n3. Modify credit limits\n\nPlease tell me which option you'd prefer."
-            )
-
-
-    async def _handle_loan_process(self, user_id: str, session_id: str, message: str, loan_process: Dict) -> ChatResponse:
+    async def _handle_loan_process(self, user_id: str, session_id: str, message: str, loan_process: Dict,
+                                   message_lower: Optional[str] = None) -> ChatResponse:
         """Handle loan application process with enhanced context switching support"""
         
-        message_lower = message.lower()
-        current_state = self.state_manager.get_state(session_id) or {}
+        if message_lower is None:
+            message_lower = message.lower()
+        
+        # Load the session state once; it is saved when the step finishes
+        async with self.state_manager.session(session_id) as current_state:
+            return await self._advance_loan_process(user_id, session_id, message, message_lower, loan_process,
+                                                    current_state)
+
+    async def _advance_loan_process(self, user_id: str, session_id: str, message: str, message_lower: str,
+                                    loan_process: Dict, current_state: Dict) -> ChatResponse:
+        """Run one step of the loan application, recording state changes in current_state"""
         
         # Check if user wants to resume a suspended loan application
-        is_resume_request = any(phrase in message_lower for phrase in [
-            'apply new loan', 'new loan', 'apply loan', 'continue loan', 'resume loan'
-        ])
+        is_resume_request = _LOAN_RESUME_RE.search(message_lower) is not None
         
         # Check for suspended loan processes
-        suspended_processes = current_state.get('suspended_processes', [])
-        suspended_loan = None
-        
-        for process in reversed(suspended_processes):  # Check most recent first
-            if process.get('multi_step_process', {}).get('type') == 'loan_application':
-                suspended_loan = process
-                break
+        suspended_loan = self._latest_suspended(current_state, 'loan_application')
         
         # If there's a suspended loan process and user wants to apply for loan
         if suspended_loan and is_resume_request and not loan_process.get('type'):
@@ -595,35 +758,38 @@ class ConversationalAgent:
             
             # Ask user if they want to resume or start fresh
             if completion > 0:
-                collected_data = suspended_loan_data.get('collected_data', {})
+                collected_data = suspended_loan_data.get('collected_data', _EMPTY)
                 current_step = suspended_loan_data.get('current_step')
                 
-                resume_message = f"I notice you were in the middle of a loan application:\n\n"
+                resume_lines = ["I notice you were in the middle of a loan application:", ""]
                 
                 if collected_data.get('amount'):
-                    resume_message += f"• Amount: ${collected_data['amount']:,.2f}\n"
+                    resume_lines.append(f"• Amount: ${collected_data['amount']:,.2f}")
                 if collected_data.get('purpose'):
-                    resume_message += f"• Purpose: {collected_data['purpose']}\n"
+                    resume_lines.append(f"• Purpose: {collected_data['purpose']}")
                 
-                resume_message += f"\n**Progress**: {completion:.0f}% complete\n\n"
-                resume_message += "Would you like to:\n1. **Continue** where you left off\n2. **Start** a completely new loan application\n\nPlease say 'continue' or 'start new'."
+                resume_lines += [
+                    "", f"**Progress**: {completion:.0f}% complete", "",
+                    "Would you like to:\n1. **Continue** where you left off\n2. **Start** a completely new loan application\n\nPlease say 'continue' or 'start new'."
+                ]
+                resume_message = "\n".join(resume_lines)
                 
                 # Set up a special state for user choice
                 current_state['loan_resume_choice'] = {
                     'suspended_process': suspended_loan_data,
                     'message_shown': True
                 }
-                self.state_manager.update_state(session_id, current_state)
                 
                 response_data = ChatResponse(response=resume_message)
-                self.context_manager.update_history(session_id, message, resume_message)
+                self._record_turn(session_id, message, resume_message)
                 return response_data
         
         # Handle resume choice
-        if current_state.get('loan_resume_choice', {}).get('message_shown'):
+        resume_choice = current_state.get('loan_resume_choice')
+        if resume_choice and resume_choice.get('message_shown'):
             if 'continue' in message_lower:
                 # Resume the suspended process
-                suspended_process = current_state['loan_resume_choice']['suspended_process']
+                suspended_process = resume_choice['suspended_process']
                 
                 # Restore the multi-step process
                 current_state['multi_step_process'] = suspended_process
@@ -632,166 +798,69 @@ class ConversationalAgent:
                 del current_state['loan_resume_choice']
                 
                 # Remove the suspended process since we're resuming it
-                suspended_processes = current_state.get('suspended_processes', [])
-                current_state['suspended_processes'] = [
-                    p for p in suspended_processes 
-                    if p.get('multi_step_process', {}).get('type') != 'loan_application'
-                ]
-                
-                self.state_manager.update_state(session_id, current_state)
+                self._drop_suspended(current_state, 'loan_application')
                 
                 # Continue with the next step
-                collected_data = suspended_process.get('collected_data', {})
+                collected_data = suspended_process.get('collected_data', _EMPTY)
                 current_step = suspended_process.get('current_step')
                 
                 if current_step == 'purpose':
-                    response_text = f"Great! Continuing with your loan application for ${collected_data['amount']:,.2f}.\n\n**Step 2: Loan Purpose**\nWhat will you use this loan for? (e.g., Home Improvement, Debt Consolidation, Auto Purchase, Medical Expenses, etc.)"
+                    response_text = _STEP_PURPOSE_TMPL.format_map(collected_data)
                 elif current_step == 'income':
-                    response_text = f"Perfect! Loan amount: ${collected_data['amount']:,.2f} for {collected_data['purpose']}.\n\n**Step 3: Annual Income**\nWhat is your annual gross income? This helps us determine your loan eligibility and interest rate."
+                    response_text = _STEP_INCOME_TMPL.format_map(collected_data)
                 else:
                     response_text = "Let's continue with your loan application. What information do you need to provide next?"
                 
                 response_data = ChatResponse(response=response_text)
-                self.context_manager.update_history(session_id, message, response_text)
+                self._record_turn(session_id, message, response_text)
                 return response_data
                 
-            elif any(phrase in message_lower for phrase in ['start new', 'new', 'fresh', 'different']):
+            elif _START_NEW_RE.search(message_lower):
                 # Start fresh - clear the suspended process
                 del current_state['loan_resume_choice']
                 
                 # Remove suspended loan processes
-                suspended_processes = current_state.get('suspended_processes', [])
-                current_state['suspended_processes'] = [
-                    p for p in suspended_processes 
-                    if p.get('multi_step_process', {}).get('type') != 'loan_application'
-                ]
-                
-                self.state_manager.update_state(session_id, current_state)
+                self._drop_suspended(current_state, 'loan_application')
                 
                 # Start new loan application
-                from tools.banking_api import apply_for_loan
-                loan_result = apply_for_loan(user_id, force_new=True)
-                
-                if loan_result.get('status') in ['info', 'success']:
-                    response_text = loan_result['message']
-                    
-                    # Update state for new loan process
-                    if loan_result.get('requires_continuation'):
-                        current_state['multi_step_process'] = {
-                            'type': loan_result.get('process_type'),
-                            'current_step': loan_result.get('current_step'),
-                            'collected_data': loan_result.get('collected_data', {}),
-                            'next_step': loan_result.get('next_step'),
-                            'is_new_application': True
-                        }
-                        self.state_manager.update_state(session_id, current_state)
-                    
-                    response_data = ChatResponse(response=response_text)
-                    self.context_manager.update_history(session_id, message, response_text)
+                response_data = await self._start_new_loan(user_id, session_id, message, current_state)
+                if response_data:
                     return response_data
             else:
                 # Invalid choice, ask again
-                response_text = "Please choose either:\n• **'continue'** - to resume your previous loan application\n• **'start new'** - to begin a fresh loan application"
-                response_data = ChatResponse(response=response_text)
-                return response_data
+                return ChatResponse(response=_RESUME_INVALID_CHOICE)
         
         # Check if user explicitly wants a new loan application (when no suspended process dialogue is active)
-        is_new_loan_request = any(phrase in message_lower for phrase in [
-            'new loan', 'apply for new loan', 'another loan', 'different loan', 
-            'start over', 'fresh loan', 'apply loan'
-        ])
+        is_new_loan_request = _NEW_LOAN_RE.search(message_lower) is not None
         
         # If it's a new loan request and there's an active process, clear it and start fresh
         if is_new_loan_request and loan_process.get('type') == 'loan_application' and not current_state.get('loan_resume_choice'):
             # Clear the current loan process
-            if 'multi_step_process' in current_state:
-                del current_state['multi_step_process']
-            self.state_manager.update_state(session_id, current_state)
+            current_state.pop('multi_step_process', None)
             
             # Start a new loan application with force_new=True
-            from tools.banking_api import apply_for_loan
-            loan_result = apply_for_loan(user_id, force_new=True)
-            
-            if loan_result.get('status') in ['info', 'success']:
-                response_text = loan_result['message']
-                
-                # Update state for new loan process
-                if loan_result.get('requires_continuation'):
-                    current_state['multi_step_process'] = {
-                        'type': loan_result.get('process_type'),
-                        'current_step': loan_result.get('current_step'),
-                        'collected_data': loan_result.get('collected_data', {}),
-                        'next_step': loan_result.get('next_step'),
-                        'is_new_application': True
-                    }
-                    self.state_manager.update_state(session_id, current_state)
-                
-                response_data = ChatResponse(response=response_text)
-                self.context_manager.update_history(session_id, message, response_text)
+            response_data = await self._start_new_loan(user_id, session_id, message, current_state)
+            if response_data:
                 return response_data
         
         # Continue with existing loan process logic...
         # [Rest of your existing _handle_loan_process method remains the same]
         
         # Extract information from current message
-        amount_match = re.search(r'\$?([0-9,]+(?:\.[0-9]{2})?)', message)
-        extracted_amount = None
-        if amount_match:
-            try:
-                extracted_amount = float(amount_match.group(1).replace(',', ''))
-            except:
-                pass
-        
-        # Extract purpose keywords
-        purpose_keywords = {
-            'home': 'Home Improvement',
-            'house': 'Home Improvement', 
-            'renovation': 'Home Renovation',
-            'car': 'Auto Purchase',
-            'vehicle': 'Auto Purchase',
-            'auto': 'Auto Purchase',
-            'debt': 'Debt Consolidation',
-            'consolidation': 'Debt Consolidation',
-            'medical': 'Medical Expenses',
-            'health': 'Medical Expenses',
-            'education': 'Education',
-            'school': 'Education',
-            'college': 'Education',
-            'business': 'Business',
-            'wedding': 'Wedding',
-            'marriage': 'Wedding',
-            'vacation': 'Vacation',
-            'travel': 'Vacation',
-            'personal': 'Personal',
-            'emergency': 'Emergency Fund'
-        }
-        
-        extracted_purpose = None
-        for keyword, purpose in purpose_keywords.items():
-            if keyword in message_lower:
-                extracted_purpose = purpose
-                break
-        
-        # Extract income from message
-        income_match = re.search(r'(?:income|earn|salary|make).*?\$?([0-9,]+(?:\.[0-9]{2})?)', message_lower)
-        extracted_income = None
-        if income_match:
-            try:
-                extracted_income = float(income_match.group(1).replace(',', ''))
-            except:
-                pass
+        extracted_amount, extracted_income, extracted_purpose = _parse_loan_fields(message, message_lower)
         
         # If we're in an active loan process, also check for simple numerical responses
-        is_numerical_response = re.match(r'^\$?[0-9,]+(?:\.[0-9]{2})?$', message.strip())
+        message_stripped = message.strip()
+        is_numerical_response = _NUM_RE.match(message_stripped)
         if loan_process.get('type') == 'loan_application' and is_numerical_response and not extracted_income:
             current_step = loan_process.get('current_step')
             if current_step == 'amount':
-                extracted_amount = float(message.strip().replace('$', '').replace(',', ''))
+                extracted_amount = float(message_stripped.replace('$', '').replace(',', ''))
             elif current_step == 'income':
-                extracted_income = float(message.strip().replace('$', '').replace(',', ''))
+                extracted_income = float(message_stripped.replace('$', '').replace(',', ''))
         
         # Get collected data from ongoing process
-        collected_data = loan_process.get('collected_data', {})
+        collected_data = loan_process.get('collected_data', _EMPTY)
         
         # Determine what information we have
         current_amount = extracted_amount or collected_data.get('amount')
@@ -799,41 +868,34 @@ class ConversationalAgent:
         current_income = extracted_income or collected_data.get('income')
         
         # Call the loan application function with database integration
-        from tools.banking_api import apply_for_loan
-        loan_result = apply_for_loan(user_id, current_amount, current_purpose, current_income)
+        loan_result = await asyncio.to_thread(apply_for_loan, user_id, current_amount, current_purpose, current_income)
         
-        if loan_result.get('status') in ['info', 'success']:
+        if loan_result.get('status') in _LOAN_REPLY_STATUSES:
             response_text = loan_result['message']
             
             # Update state if this is a multi-step process
-            current_state = self.state_manager.get_state(session_id) or {}
             if loan_result.get('requires_continuation'):
-                current_state['multi_step_process'] = {
-                    'type': loan_result.get('process_type'),
-                    'current_step': loan_result.get('current_step'),
-                    'collected_data': loan_result.get('collected_data', {}),
-                    'next_step': loan_result.get('next_step')
-                }
-                self.state_manager.update_state(session_id, current_state)
+                current_state['multi_step_process'] = _multi_step_process(
+                    loan_result, next_step=loan_result.get('next_step')
+                )
             elif loan_result.get('process_complete'):
+                self._invalidate_user_context(user_id)
+                
                 # Clear the multi-step process state when application is complete
-                if 'multi_step_process' in current_state:
-                    del current_state['multi_step_process']
+                current_state.pop('multi_step_process', None)
                 
                 # Add success flag to indicate completion
                 current_state['last_completed_action'] = {
                     'type': 'loan_application',
-                    'application_id': loan_result.get('application', {}).get('application_id'),
+                    'application_id': loan_result.get('application', _EMPTY).get('application_id'),
                     'timestamp': datetime.now().isoformat()
                 }
                 
-                self.state_manager.update_state(session_id, current_state)
-                
                 # Add context switch message for completed loan application
                 response_text += f"\n\n💡 **Note**: Your loan application has been successfully submitted and saved to our database. Is there anything else I can help you with today?"
             
             response_data = ChatResponse(response=response_text)
-            self.context_manager.update_history(session_id, message, response_text)
+            self._record_turn(session_id, message, response_text)
             return response_data
         else:
             # Handle error cases with helpful messages
@@ -849,16 +911,34 @@ class ConversationalAgent:
                 error_message += "\n\nPlease provide your annual gross income. For example: '$75,000' or 'I make 75000 annually'"
             
             response_data = ChatResponse(response=error_message)
-            self.context_manager.update_history(session_id, message, error_message)
+            self._record_turn(session_id, message, error_message)
             return response_data
 
 
 
+    async def _start_new_loan(self, user_id: str, session_id: str, message: str,
+                              current_state: Dict) -> Optional[ChatResponse]:
+        """Begin a fresh loan application; None if the banking API could not start one"""
+        
+        loan_result = await asyncio.to_thread(apply_for_loan, user_id, force_new=True)
+        
+        if loan_result.get('status') not in _LOAN_REPLY_STATUSES:
+            return None
+        
+        # Update state for new loan process
+        if loan_result.get('requires_continuation'):
+            current_state['multi_step_process'] = _multi_step_process(
+                loan_result, next_step=loan_result.get('next_step'), is_new_application=True
+            )
+        
+        response_text = loan_result['message']
+        self._record_turn(session_id, message, response_text)
+        return ChatResponse(response=response_text)
+
     async def _handle_loan_status_query(self, user_id: str, session_id: str, message: str) -> ChatResponse:
         """Handle loan status queries"""
         
-        from tools.banking_api import get_loan_status
-        loan_result = get_loan_status(user_id)
+        loan_result = await asyncio.to_thread(get_loan_status, user_id)
         
         if loan_result.get('status') == 'success':
             if loan_result.get('applications'):
@@ -876,50 +956,39 @@ Would you like to apply for a new loan or check the status of an existing applic
                 response_text = loan_result['message']
             
             response_data = ChatResponse(response=response_text)
-            self.context_manager.update_history(session_id, message, response_text)
+            self._record_turn(session_id, message, response_text)
             return response_data
         
         return ChatResponse(response="Unable to retrieve loan information. Please try again.")
 
-    async def _handle_pending_actions(self, user_id: str, session_id: str, message: str, pending_action: Dict) -> ChatResponse:
+    async def _handle_pending_actions(self, user_id: str, session_id: str, message: str, pending_action: Dict,
+                                      message_lower: Optional[str] = None) -> ChatResponse:
         """Handle pending actions (selections, confirmations, etc.)"""
         
-        action_type = pending_action.get('process_type')
-        
-        if action_type == 'card_management':
-            return await self._handle_card_management_selection(user_id, session_id, message, pending_action)
-        elif action_type == 'new_card_application':
-            return await self._handle_new_card_application_selection(user_id, session_id, message, pending_action)
-        elif action_type == 'card_application':  # Legacy support
-            return await self._handle_card_application_selection(user_id, session_id, message, pending_action)
-        elif action_type == 'limit_modification':
-            return await self._handle_limit_modification_selection(user_id, session_id, message, pending_action)
-        elif action_type == 'card_blocking':
-            return await self._handle_card_blocking_selection(user_id, session_id, message, pending_action)
-        else:
-            # Fallback for any unrecognized action types
-            return await self._handle_card_blocking_selection(user_id, session_id, message, pending_action)
+        handler = self._pending_dispatch.get(pending_action.get('process_type'), self._handle_card_blocking_selection)
+        return await handler(user_id, session_id, message, pending_action, message_lower)
 
 
 
-    async def _handle_card_management_selection(self, user_id: str, session_id: str, message: str, pending_action: Dict) -> ChatResponse:
+    async def _handle_card_management_selection(self, user_id: str, session_id: str, message: str, pending_action: Dict,
+                                                message_lower: Optional[str] = None) -> ChatResponse:
         """Handle card management option selection"""
         
-        message_lower = message.lower()
+        if message_lower is None:
+            message_lower = message.lower()
         selected_option = None
         
         # Check for selection keywords
-        if any(phrase in message_lower for phrase in ['block_card', 'block card', 'option 1']):
+        if _BLOCK_CARD_OPTION_RE.search(message_lower):
             selected_option = 'block_card'
-        elif any(phrase in message_lower for phrase in ['apply_new_card', 'new card', 'apply', 'option 2']):
+        elif _NEW_CARD_OPTION_RE.search(message_lower):
             selected_option = 'apply_new_card'
-        elif any(phrase in message_lower for phrase in ['modify_limit', 'limit', 'credit limit', 'option 3']):
+        elif _MODIFY_LIMIT_OPTION_RE.search(message_lower):
             selected_option = 'modify_limit'
         
         if selected_option == 'block_card':
             # Show user cards for blocking
-            from tools.banking_api import get_user_cards
-            cards_result = get_user_cards(user_id)
+            cards_result = await asyncio.to_thread(get_user_cards, user_id)
             
             if cards_result.get("requires_selection"):
                 response_data = ChatResponse(
@@ -929,7 +998,7 @@ Would you like to apply for a new loan or check the status of an existing applic
                 )
                 
                 # Update pending action
-                self.state_manager.update_state(session_id, {
+                await asyncio.to_thread(self.state_manager.update_state, session_id, {
                     "pending_action": {
                         "tool": "block_card",
                         "args": {},
@@ -940,7 +1009,6 @@ Would you like to apply for a new loan or check the status of an existing applic
                 
         elif selected_option == 'apply_new_card':
             # Show card type options
-            from tools.banking_api import new_card_type
             type_result = new_card_type(user_id)
             
             if type_result.get("requires_selection"):
@@ -951,7 +1019,7 @@ Would you like to apply for a new loan or check the status of an existing applic
                 )
                 
                 # Update pending action
-                self.state_manager.update_state(session_id, {
+                await asyncio.to_thread(self.state_manager.update_state, session_id, {
                     "pending_action": {
                         "tool": "card_application",
                         "step": "type_selection",
@@ -963,8 +1031,7 @@ Would you like to apply for a new loan or check the status of an existing applic
                 
         elif selected_option == 'modify_limit':
             # Show credit cards for limit modification
-            from tools.banking_api import limit_modification_cards
-            limit_result = limit_modification_cards(user_id)
+            limit_result = await asyncio.to_thread(limit_modification_cards, user_id)
             
             if limit_result.get("requires_selection"):
                 response_data = ChatResponse(
@@ -974,7 +1041,7 @@ Would you like to apply for a new loan or check the status of an existing applic
                 )
                 
                 # Update pending action
-                self.state_manager.update_state(session_id, {
+                await asyncio.to_thread(self.state_manager.update_state, session_id, {
                     "pending_action": {
                         "tool": "limit_modification",
                         "step": "card_selection",
@@ -987,47 +1054,46 @@ Would you like to apply for a new loan or check the status of an existing applic
                 response_text = limit_result.get('message', 'No credit cards available for limit modification.')
                 response_data = ChatResponse(response=response_text)
                 # Clear pending action
-                current_state = self.state_manager.get_state(session_id) or {}
-                if 'pending_action' in current_state:
-                    del current_state['pending_action']
-                self.state_manager.update_state(session_id, current_state)
+                async with self.state_manager.session(session_id) as current_state:
+                    current_state.pop('pending_action', None)
                 return response_data
         
         return ChatResponse(response="Please select a valid option from the menu.")
-    async def _handle_loan_listing_query(self, user_id: str, session_id: str, message: str) -> ChatResponse:
+    async def _handle_loan_listing_query(self, user_id: str, session_id: str, message: str,
+                                         current_state: Optional[Dict] = None) -> ChatResponse:
         """Handle loan listing queries - shows all user's loan applications"""
         
         try:
-            await self._save_current_process_on_context_switch(session_id, 'loan_listing')
+            await self._save_current_process_on_context_switch(session_id, 'loan_listing', current_state)
             
-            from tools.banking_api import get_loan_status
-            loan_result = get_loan_status(user_id)
+            loan_result = await asyncio.to_thread(get_loan_status, user_id)
             
             if loan_result.get('status') == 'success':
                 if loan_result.get('applications'):
                     # Format the loans in a detailed manner
                     apps_text = []
                     for app in loan_result['applications']:
-                        status_display = app['status'].title()
-                        app_line = f"• **{app['application_id']}**: ${app['amount']:,.2f} for {app['purpose']}"
-                        app_line += f"\n  - Status: {status_display}"
+                        app_lines = [
+                            f"• **{app['application_id']}**: ${app['amount']:,.2f} for {app['purpose']}",
+                            f"  - Status: {app['status'].title()}"
+                        ]
                         
                         if app.get('interest_rate'):
-                            app_line += f"\n  - Interest Rate: {app['interest_rate']}%"
+                            app_lines.append(f"  - Interest Rate: {app['interest_rate']}%")
                         
                         if app.get('monthly_payment'):
-                            app_line += f"\n  - Monthly Payment: ${app['monthly_payment']:,.2f}"
+                            app_lines.append(f"  - Monthly Payment: ${app['monthly_payment']:,.2f}")
                         elif app.get('estimated_monthly_payment'):
-                            app_line += f"\n  - Estimated Monthly Payment: ${app['estimated_monthly_payment']:,.2f}"
+                            app_lines.append(f"  - Estimated Monthly Payment: ${app['estimated_monthly_payment']:,.2f}")
                         
-                        if app.get('applied_date') or app.get('created_date'):
-                            app_date = app.get('applied_date') or app.get('created_date')
-                            app_line += f"\n  - Applied Date: {app_date}"
+                        app_date = app.get('applied_date') or app.get('created_date')
+                        if app_date:
+                            app_lines.append(f"  - Applied Date: {app_date}")
                         
                         if app.get('approved_date'):
-                            app_line += f"\n  - Approved Date: {app['approved_date']}"
+                            app_lines.append(f"  - Approved Date: {app['approved_date']}")
                         
-                        apps_text.append(app_line)
+                        apps_text.append("\n".join(app_lines))
                     
                     formatted_apps = "\n\n".join(apps_text)
                     
@@ -1042,36 +1108,37 @@ Would you like to apply for a new loan or check the status of an existing applic
     • Check the status of a specific application
     • Get more details about any loan
 
-    {await self._get_context_switch_message(session_id)}"""
+    {await self._get_context_switch_message(session_id, current_state)}"""
                 else:
                     response_text = loan_result['message']
                 
                 response_data = ChatResponse(response=response_text)
-                self.context_manager.update_history(session_id, message, response_text)
+                self._record_turn(session_id, message, response_text)
                 return response_data
             
             return ChatResponse(response="Unable to retrieve your loan applications. Please try again.")
             
-        except Exception as e:
-            print(f"Loan Listing Error: {str(e)}")
+        except Exception:
+            logger.exception("Loan Listing Error")
             return ChatResponse(response="I'm having trouble accessing your loan information right now. Please try again.")
 
-    async def _handle_card_application_selection(self, user_id: str, session_id: str, message: str, pending_action: Dict) -> ChatResponse:
+    async def _handle_card_application_selection(self, user_id: str, session_id: str, message: str, pending_action: Dict,
+                                                 message_lower: Optional[str] = None) -> ChatResponse:
         """Handle card application selections"""
         
         current_step = pending_action.get('step')
-        message_lower = message.lower()
+        if message_lower is None:
+            message_lower = message.lower()
         
         if current_step == 'type_selection':
             selected_type = None
-            if any(phrase in message_lower for phrase in ['credit_card', 'credit', 'option 1']):
+            if _CREDIT_CARD_OPTION_RE.search(message_lower):
                 selected_type = 'credit_card'
-            elif any(phrase in message_lower for phrase in ['debit_card', 'debit', 'option 2']):
+            elif _DEBIT_CARD_OPTION_RE.search(message_lower):
                 selected_type = 'debit_card'
             
             if selected_type:
                 # Show brand options
-                from tools.banking_api import card_brand_selection
                 brand_result = card_brand_selection(user_id, selected_type)
                 
                 if brand_result.get("requires_selection"):
@@ -1082,7 +1149,7 @@ Would you like to apply for a new loan or check the status of an existing applic
                     )
                     
                     # Update pending action
-                    self.state_manager.update_state(session_id, {
+                    await asyncio.to_thread(self.state_manager.update_state, session_id, {
                         "pending_action": {
                             "tool": "card_application",
                             "step": "brand_selection",
@@ -1095,89 +1162,69 @@ Would you like to apply for a new loan or check the status of an existing applic
                     
         elif current_step == 'brand_selection':
             selected_brand = None
-            if any(phrase in message_lower for phrase in ['visa', 'option 1']):
+            if _VISA_OPTION_RE.search(message_lower):
                 selected_brand = 'visa'
-            elif any(phrase in message_lower for phrase in ['mastercard', 'option 2']):
+            elif _MASTERCARD_OPTION_RE.search(message_lower):
                 selected_brand = 'mastercard'
-            elif any(phrase in message_lower for phrase in ['rupay', 'option 3']):
+            elif _RUPAY_OPTION_RE.search(message_lower):
                 selected_brand = 'rupay'
             
             if selected_brand:
                 # Apply for the card
                 card_type = pending_action.get('card_type')
-                from tools.banking_api import apply_new_card
-                application_result = apply_new_card(user_id, card_type, selected_brand)
+                application_result = await asyncio.to_thread(apply_new_card, user_id, card_type, selected_brand)
+                self._invalidate_user_context(user_id)
+                
+                # Clear pending action
+                async with self.state_manager.session(session_id) as current_state:
+                    current_state.pop('pending_action', None)
                 
                 response_text = application_result.get('message', 'Card application processed successfully!')
                 
                 # Add context switch message if needed
-                response_text += f"\n\n{await self._get_context_switch_message(session_id)}"
+                response_text += f"\n\n{await self._get_context_switch_message(session_id, current_state)}"
                 
                 response_data = ChatResponse(response=response_text)
-                
-                # Clear pending action
-                current_state = self.state_manager.get_state(session_id) or {}
-                if 'pending_action' in current_state:
-                    del current_state['pending_action']
-                self.state_manager.update_state(session_id, current_state)
-                
-                self.context_manager.update_history(session_id, message, response_text)
+                self._record_turn(session_id, message, response_text)
                 return response_data
         
         return ChatResponse(response="Please select a valid option.")
 
-    async def _handle_limit_modification_selection(self, user_id: str, session_id: str, message: str, pending_action: Dict) -> ChatResponse:
+    async def _handle_limit_modification_selection(self, user_id: str, session_id: str, message: str, pending_action: Dict,
+                                                   message_lower: Optional[str] = None) -> ChatResponse:
         """Handle credit limit modification selections"""
         
+        if message_lower is None:
+            message_lower = message.lower()
+        
         current_step = pending_action.get('step')
         
         if current_step == 'card_selection':
             # Extract card ID from selection
-            card_match = re.search(r'card_(\d+)', message.lower())
+            card_match = _CARD_RE.search(message_lower)
             if card_match:
                 card_id = f"card_{card_match.group(1).zfill(3)}"
                 
                 # Get current limit info
-                from tools.banking_api import get_limit_info
-                limit_info = get_limit_info(user_id, card_id)
+                limit_info = await asyncio.to_thread(get_limit_info, user_id, card_id)
                 
                 if limit_info.get('requires_continuation'):
                     response_text = limit_info.get('message')
                     
                     # Update state for limit modification - IMPORTANT: Use 'multi_step_process' not pending_action
-                    current_state = self.state_manager.get_state(session_id) or {}
-                    current_state['multi_step_process'] = {
-                        'type': limit_info.get('process_type'),
-                        'current_step': limit_info.get('current_step'),
-                        'collected_data': limit_info.get('collected_data', {}),
-                        'card_id': card_id
-                    }
-                    
-                    # Clear pending action since we're moving to multi-step process
-                    if 'pending_action' in current_state:
-                        del current_state['pending_action']
-                    
-                    self.state_manager.update_state(session_id, current_state)
+                    async with self.state_manager.session(session_id) as current_state:
+                        current_state['multi_step_process'] = _multi_step_process(limit_info, card_id=card_id)
+                        
+                        # Clear pending action since we're moving to multi-step process
+                        current_state.pop('pending_action', None)
                     
                     response_data = ChatResponse(response=response_text)
-                    self.context_manager.update_history(session_id, message, response_text)
+                    self._record_turn(session_id, message, response_text)
                     return response_data
         
         return ChatResponse(response="Please select a valid card option.")
 
 
-    async def _handle_multi_step_processes(self, user_id: str, session_id: str, message: str, current_state: Dict) -> ChatResponse:
-        """Handle ongoing multi-step processes"""
-        
-        multi_step = current_state.get('multi_step_process', {})
-        process_type = multi_step.get('type')
-        
-        if process_type == 'limit_modification':
-            return await self._handle_limit_modification_process(user_id, session_id, message, multi_step)
-        
-        # Handle other multi-step processes here
-        return ChatResponse(response="Process not recognized. Please try again.")
-
     async def _handle_limit_modification_process(self, user_id: str, session_id: str, message: str, multi_step: Dict) -> ChatResponse:
         """Handle limit modification multi-step process"""
         
@@ -1185,33 +1232,31 @@ Would you like to apply for a new loan or check the status of an existing applic
         
         if current_step == 'new_limit':
             # Extract new limit amount from user input
-            amount_match = re.search(r'\$?([0-9,]+(?:\.[0-9]{2})?)', message)
+            amount_match = _AMOUNT_RE.search(message)
             if amount_match:
                 try:
                     new_limit = float(amount_match.group(1).replace(',', ''))
-                    card_id = multi_step.get('collected_data', {}).get('card_id')
+                    card_id = multi_step.get('collected_data', _EMPTY).get('card_id')
                     
                     if not card_id:
-                        return ChatResponse(response="Error: Card information not found. Please start the process again.")
+                        return _ERR_CARD_MISSING
                     
                     # Modify the credit limit
-                    from tools.banking_api import modify_credit_limit
-                    modify_result = modify_credit_limit(user_id, card_id, new_limit)
+                    modify_result = await asyncio.to_thread(modify_credit_limit, user_id, card_id, new_limit)
                     
                     if modify_result.get('status') == 'success':
+                        self._invalidate_user_context(user_id)
+                        # Clear multi-step process
+                        async with self.state_manager.session(session_id) as current_state:
+                            current_state.pop('multi_step_process', None)
+                        
                         response_text = modify_result.get('message', 'Credit limit modified successfully!')
                         
                         # Add context switch message
-                        response_text += f"\n\n{await self._get_context_switch_message(session_id)}"
-                        
-                        # Clear multi-step process
-                        current_state = self.state_manager.get_state(session_id) or {}
-                        if 'multi_step_process' in current_state:
-                            del current_state['multi_step_process']
-                        self.state_manager.update_state(session_id, current_state)
+                        response_text += f"\n\n{await self._get_context_switch_message(session_id, current_state)}"
                         
                         response_data = ChatResponse(response=response_text)
-                        self.context_manager.update_history(session_id, message, response_text)
+                        self._record_turn(session_id, message, response_text)
                         return response_data
                     else:
                         error_message = modify_result.get('message', 'Failed to modify credit limit.')
@@ -1219,72 +1264,99 @@ Would you like to apply for a new loan or check the status of an existing applic
                         return response_data
                         
                 except ValueError:
-                    return ChatResponse(response="Please enter a valid numeric amount for the credit limit. For example: 20000 or $20,000")
+                    return _ERR_INVALID_AMOUNT
             else:
-                return ChatResponse(response="Please specify the new credit limit amount. For example: 20000 or $20,000")
+                return _ERR_MISSING_AMOUNT
         
         return ChatResponse(response="Unable to process limit modification. Please try again.")
 
 
-    async def _save_current_process_on_context_switch(self, session_id: str, new_context: str):
+    async def _save_current_process_on_context_switch(self, session_id: str, new_context: str,
+                                                      current_state: Optional[Dict] = None):
         """Enhanced save current process when context switches occur"""
         
-        current_state = self.state_manager.get_state(session_id) or {}
+        # With this turn's state already loaded, a session without an active process needs no write
+        if current_state is not None and not current_state.get('multi_step_process'):
+            return
+        
+        async with self.state_manager.session(session_id, current_state) as state:
+            self._suspend_active_process(state, new_context)
+
+    def _suspend_active_process(self, current_state: Dict, new_context: str):
+        """Record the active multi-step process (if any) as suspended in current_state"""
         
         # Check if there's an active multi-step process
         active_process = current_state.get('multi_step_process')
         
         if active_process:
-            if 'suspended_processes' not in current_state:
-                current_state['suspended_processes'] = []
+            suspended = self._suspended(current_state)
+            process_type = active_process.get('type') or 'unknown'
             
-            # Save the current process with more details
-            suspended_process = {
+            # Save the current process with more details; re-inserting keeps the newest last
+            suspended.pop(process_type, None)
+            suspended[process_type] = {
                 'context': new_context,
                 'timestamp': datetime.now().isoformat(),
-                'multi_step_process': active_process.copy(),
+                'multi_step_process': active_process,  # shared: the active entry is replaced, never edited in place
                 'original_context': active_process.get('type'),
                 'completion_percentage': self._calculate_process_completion(active_process)
             }
             
-            current_state['suspended_processes'].append(suspended_process)
+            current_state['suspended_processes'] = suspended
             current_state['context_switched'] = True
             current_state['last_context_switch'] = new_context
-            
-            self.state_manager.update_state(session_id, current_state)
+
+    def _suspended(self, current_state: Dict) -> Dict[str, Dict]:
+        """Suspended processes keyed by process type, oldest first (sessions saved as a list are converted)"""
+        suspended = current_state.get('suspended_processes')
+        if suspended is None:
+            return {}
+        if isinstance(suspended, list):
+            converted = {}
+            for process in suspended:
+                process_type = process.get('multi_step_process', _EMPTY).get('type') or 'unknown'
+                converted.pop(process_type, None)
+                converted[process_type] = process
+            suspended = current_state['suspended_processes'] = converted
+        return suspended
+
+    def _latest_suspended(self, current_state: Dict, process_type: str) -> Optional[Dict]:
+        """Most recently suspended process of the given type, if any"""
+        return self._suspended(current_state).get(process_type)
+
+    def _drop_suspended(self, current_state: Dict, process_type: str):
+        """Remove the suspended process of the given type"""
+        self._suspended(current_state).pop(process_type, None)
 
     def _calculate_process_completion(self, process: Dict) -> float:
         """Calculate how much of a multi-step process is complete"""
         
         if process.get('type') == 'loan_application':
-            collected_data = process.get('collected_data', {})
+            collected_data = process.get('collected_data', _EMPTY)
             total_steps = 3  # amount, purpose, income
-            completed_steps = len([v for v in collected_data.values() if v is not None])
+            completed_steps = sum(1 for v in collected_data.values() if v is not None)
             return (completed_steps / total_steps) * 100
         
         return 0.0
 
 
-    async def _get_context_switch_message(self, session_id: str) -> str:
+    async def _get_context_switch_message(self, session_id: str, current_state: Optional[Dict] = None) -> str:
         """Enhanced context switch message with loan-specific guidance"""
         
-        current_state = self.state_manager.get_state(session_id) or {}
-        suspended_processes = current_state.get('suspended_processes', [])
+        if current_state is None:
+            current_state = await asyncio.to_thread(self.state_manager.get_state, session_id) or {}
+        suspended_processes = self._suspended(current_state)
         
         if suspended_processes:
             # Check for suspended loan application
-            suspended_loan = None
-            for process in reversed(suspended_processes):
-                if process.get('multi_step_process', {}).get('type') == 'loan_application':
-                    suspended_loan = process
-                    break
+            suspended_loan = suspended_processes.get('loan_application')
             
             if suspended_loan:
                 completion = suspended_loan.get('completion_percentage', 0)
                 if completion > 0:
                     return f"💡 **Note**: You have a loan application {completion:.0f}% complete. Say 'continue loan' to resume or 'new loan' to start fresh."
             
-            latest_process = suspended_processes[-1]
+            latest_process = next(reversed(suspended_processes.values()))
             multi_step = latest_process.get('multi_step_process')
             
             if multi_step:
@@ -1297,37 +1369,27 @@ Would you like to apply for a new loan or check the status of an existing applic
         return ""
 
 
-    async def _handle_llm_failure(self, session_id: str, message: str, current_state: Dict, error: Exception) -> ChatResponse:
+    async def _handle_llm_failure(self, session_id: str, message: str, current_state: Dict, error: Exception,
+                                  message_lower: Optional[str] = None) -> ChatResponse:
         """Handle LLM failures with context-aware fallbacks"""
         
-        error_msg = str(error)
-        print(f"LLM Error: {error_msg}")  # For debugging
+        logger.error("LLM Error", exc_info=error)
         
-        message_lower = message.lower()
-        loan_process = current_state.get('multi_step_process', {})
+        if message_lower is None:
+            message_lower = message.lower()
+        loan_process = current_state.get('multi_step_process', _EMPTY)
         
         # Provide intelligent fallback based on message content and active processes
         if loan_process.get('type') == 'loan_application':
-            current_step = loan_process.get('current_step', 'unknown')
-            if current_step == 'amount':
-                fallback_text = "I'm having trouble processing your loan amount. Could you please specify the loan amount you need? For example: '$15,000' or 'I need $15000'"
-            elif current_step == 'purpose':
-                fallback_text = "I need to know the purpose of your loan. What will you use this loan for? (e.g., home renovation, car purchase, debt consolidation)"
-            elif current_step == 'income':
-                fallback_text = "To complete your loan application, I need your annual income information. What is your yearly gross income?"
-            else:
-                fallback_text = "I'm having trouble with your loan application. Let me help you start over. What loan amount do you need?"
-        elif "balance" in message_lower:
-            fallback_text = "I'd be happy to help you check your account balance. Let me retrieve that information for you."
-        elif "card" in message_lower:
-            fallback_text = "I can help you with your card services. What would you like to do with your cards today?"
-        elif "loan" in message_lower:
-            fallback_text = "I'm here to assist with your loan inquiries. What specific information about loans can I help you with?"
+            response_data = _LOAN_STEP_FALLBACKS.get(loan_process.get('current_step'), _FALLBACK_LOAN_RESTART)
         else:
-            fallback_text = "I'm here to help with your banking needs. You can ask me about your account balance, cards, transactions, or loan applications. What would you like to know?"
+            # One scan for all fallback keywords, then the first keyword in table order wins
+            hits = set(_FALLBACK_KEYWORD_RE.findall(message_lower))
+            response_data = next(
+                (response for keyword, response in _FALLBACK_BY_KEYWORD.items() if keyword in hits), _FALLBACK_GENERAL
+            )
         
-        response_data = ChatResponse(response=fallback_text)
-        self.context_manager.update_history(session_id, message, fallback_text)
+        self._record_turn(session_id, message, response_data.response)
         return response_data
 
     # [Rest of the methods remain the same as in the previous version]
@@ -1335,19 +1397,24 @@ Would you like to apply for a new loan or check the status of an existing applic
     # _execute_tool_with_context, _handle_selection_process, _handle_multi_step_process,
     # _generate_contextual_response, _get_user_context, _get_user_profile, _update_conversation_context
 
-    async def _analyze_context_switch(self, session_id: str, message: str):
+    async def _analyze_context_switch(self, session_id: str, message: str, current_state: Optional[Dict] = None,
+                                      message_lower: Optional[str] = None):
         """Detect and handle context switches in conversation"""
         
-        current_state = self.state_manager.get_state(session_id)
-        if not current_state:
+        # Detect topic changes using keyword analysis; a message with no banking topic can't switch
+        # context, so short replies like "ok" or "yes" skip the state work entirely
+        new_topics = self._extract_topics(message, message_lower)
+        if not new_topics:
             return
         
-        # Detect topic changes using keyword analysis
+        if current_state is None:
+            current_state = await asyncio.to_thread(self.state_manager.get_state, session_id)
+        if not current_state:
+            return
         current_topics = current_state.get('active_topics', [])
-        new_topics = self._extract_topics(message)
         
-        # Check for context switch
-        if new_topics and not any(topic in current_topics for topic in new_topics):
+        # Check for context switch (topics stay lists in state, which is stored as JSON)
+        if frozenset(new_topics).isdisjoint(current_topics):
             # Context switch detected
             current_state['context_switch'] = {
                 'from_topics': current_topics,
@@ -1362,58 +1429,52 @@ Would you like to apply for a new loan or check the status of an existing applic
                 current_state['suspended_tasks'].append(current_state['current_task'])
             
             current_state['active_topics'] = new_topics
-            self.state_manager.update_state(session_id, current_state)
+            await asyncio.to_thread(self.state_manager.set_state, session_id, current_state)
 
-    def _extract_topics(self, message: str) -> list:
+    def _extract_topics(self, message: str, message_lower: Optional[str] = None) -> list:
         """Extract banking topics from user message"""
         
-        topic_keywords = {
-            'loan': ['loan', 'borrow', 'credit', 'mortgage', 'financing'],
-            'card': ['card', 'debit', 'credit', 'block', 'lost', 'stolen'],
-            'account': ['balance', 'statement', 'transaction', 'account', 'deposit'],
-            'transfer': ['transfer', 'send', 'payment', 'wire'],
-            'information': ['rate', 'fee', 'policy', 'information', 'help']
-        }
-        
-        detected_topics = []
-        message_lower = message.lower()
-        
-        for topic, keywords in topic_keywords.items():
-            if any(keyword in message_lower for keyword in keywords):
-                detected_topics.append(topic)
-        
-        return detected_topics
+        if message_lower is None:
+            message_lower = message.lower()
+        return [topic for topic, pattern in _TOPIC_PATTERNS.items() if pattern.search(message_lower)]
 
-    async def _prepare_intelligent_prompt(self, user_id: str, session_id: str, message: str):
+    async def _prepare_intelligent_prompt(self, user_id: str, session_id: str, message: str,
+                                          current_state: Optional[Dict] = None):
         """Prepare prompt with enhanced intelligence and context awareness"""
         
-        # Get comprehensive context
-        history = self.context_manager.get_conversation_history(session_id)
-        current_state = self.state_manager.get_state(session_id)
+        # Get comprehensive context (the history read first commits any queued rows, so keep it off the loop)
+        history = await asyncio.to_thread(self.context_manager.get_conversation_history, session_id, 5)
+        if current_state is None:
+            current_state = await asyncio.to_thread(self.state_manager.get_state, session_id)
         user_profile = await self._get_user_profile(user_id)
         
-        # Build intelligent prompt with context awareness
-        prompt_parts = []
+        # Per-turn recall (history and session state) is returned separately from the prompt
+        recall_parts = []
         
         # Add conversation context
         if history:
-            prompt_parts.append("RECENT CONVERSATION:")
-            for turn in history[-5:]:  # Last 5 turns for context
-                prompt_parts.append(f"User: {turn['user']}")
-                prompt_parts.append(f"Assistant: {turn['assistant']}")
+            recall_parts.append("RECENT CONVERSATION:")
+            recall_parts.extend(  # Last 5 turns for context
+                f"User: {turn['user']}\nAssistant: {turn['assistant']}" for turn in history
+            )
         
         # Add state context
         if current_state:
-            prompt_parts.append(f"\nCURRENT CONTEXT:")
-            if current_state.get('context_switch'):
-                switch_info = current_state['context_switch']
-                prompt_parts.append(f"Context Switch Detected: From {switch_info['from_topics']} to {switch_info['to_topics']}")
+            recall_parts.append("\nCURRENT CONTEXT:")
+            switch_info = current_state.get('context_switch')
+            if switch_info:
+                recall_parts.append(f"Context Switch Detected: From {switch_info['from_topics']} to {switch_info['to_topics']}")
             
-            if current_state.get('suspended_tasks'):
-                prompt_parts.append(f"Suspended Tasks: {current_state['suspended_tasks']}")
+            suspended_tasks = current_state.get('suspended_tasks')
+            if suspended_tasks:
+                recall_parts.append(f"Suspended Tasks: {suspended_tasks}")
             
-            if current_state.get('current_task'):
-                prompt_parts.append(f"Current Task: {current_state['current_task']}")
+            current_task = current_state.get('current_task')
+            if current_task:
+                recall_parts.append(f"Current Task: {current_task}")
+        
+        # Build intelligent prompt with context awareness
+        prompt_parts = []
         
         # Add user profile context
         if user_profile:
@@ -1421,38 +1482,30 @@ Would you like to apply for a new loan or check the status of an existing applic
             prompt_parts.append(f"Account Type: {user_profile.get('account_type', 'Standard')}")
             prompt_parts.append(f"Preferred Communication: {user_profile.get('communication_style', 'Professional')}")
         
-        # Add current message with intelligent analysis
+        # Add current message with intelligent analysis (the fixed instructions are in _TURN_SYSTEM_PROMPT)
         prompt_parts.append(f"\nCURRENT USER MESSAGE: {message}")
         
-        # Add instructions for intelligent response
-        prompt_parts.append(f"\nINSTRUCTIONS:")
-        prompt_parts.append("1. Analyze the user's intent considering full conversation context")
-        prompt_parts.append("2. Handle context switches gracefully - acknowledge topic changes")
-        prompt_parts.append("3. For ambiguous requests, ask intelligent clarifying questions")
-        prompt_parts.append("4. Use tools when real-time data or actions are needed")
-        prompt_parts.append("5. Maintain awareness of suspended tasks and offer to resume them")
-        prompt_parts.append("6. Provide personalized responses based on user profile")
-        
-        full_prompt = "\n".join(prompt_parts)
+        full_prompt = "\n".join(prompt_parts).lstrip("\n")
+        recall = "\n".join(recall_parts).lstrip("\n")
         
-        # Get tool definitions
-        from tools.definitions import TOOL_DEFINITIONS
-        return full_prompt, TOOL_DEFINITIONS
+        return full_prompt, recall, TOOL_DEFINITIONS
 
-    async def _execute_tool_with_context(self, user_id: str, session_id: str, tool_name: str, tool_args: dict):
+    async def _execute_tool_with_context(self, user_id: str, session_id: str, tool_name: str, tool_args: dict,
+                                         current_state: Optional[Dict] = None):
         """Execute tools with full context awareness"""
         
         # Add session context to tool arguments
         tool_args['session_id'] = session_id
         
         # Execute tool
-        result = self.tool_executor.execute(user_id, tool_name, **tool_args)
+        result = await asyncio.to_thread(self.tool_executor.execute, user_id, tool_name, **tool_args)
+        if tool_name in _WRITE_TOOLS:
+            self._invalidate_user_context(user_id)
         
         # Update task tracking
-        current_state = self.state_manager.get_state(session_id) or {}
-        current_state['last_tool_used'] = tool_name
-        current_state['last_tool_result'] = result
-        self.state_manager.update_state(session_id, current_state)
+        async with self.state_manager.session(session_id, current_state) as state:
+            state['last_tool_used'] = tool_name
+            state['last_tool_result'] = result
         
         return result
 
@@ -1466,7 +1519,7 @@ Would you like to apply for a new loan or check the status of an existing applic
         )
         
         # Save selection state
-        self.state_manager.update_state(session_id, {
+        await asyncio.to_thread(self.state_manager.update_state, session_id, {
             "pending_action": {
                 "tool": tool_call.name,
                 "args": tool_call.arguments,
@@ -1480,20 +1533,16 @@ Would you like to apply for a new loan or check the status of an existing applic
     async def _handle_multi_step_processes(self, user_id: str, session_id: str, message: str, current_state: Dict) -> ChatResponse:
         """Handle ongoing multi-step processes"""
         
-        multi_step = current_state.get('multi_step_process', {})
-        process_type = multi_step.get('type')
-        
-        if process_type == 'limit_modification':
-            return await self._handle_limit_modification_process(user_id, session_id, message, multi_step)
-        elif process_type == 'loan_application':
-            # Handle loan application multi-step process
-            return await self._handle_loan_process(user_id, session_id, message, multi_step)
+        multi_step = current_state.get('multi_step_process', _EMPTY)
+        handler = self._process_dispatch.get(multi_step.get('type'))
+        if handler:
+            return await handler(user_id, session_id, message, multi_step)
         
         # Handle other multi-step processes here
-        return ChatResponse(response="Process not recognized. Please try again.")
+        return _ERR_UNRECOGNIZED_PROCESS
 
     async def _generate_contextual_response(self, session_id: str, tool_name: str, tool_result: Any, 
-                                          user_message: str, system_prompt: str):
+                                          user_message: str, system_prompt: str, context: str = None):
         """Generate contextually aware final response"""
         
         # Build context-rich prompt for final response
@@ -1501,7 +1550,7 @@ Would you like to apply for a new loan or check the status of an existing applic
 Based on the tool execution result, generate a helpful, personalized response.
 
 Tool Used: {tool_name}
-Tool Result: {json.dumps(tool_result, indent=2)}
+Tool Result: {_compact_json(tool_result)}
 User's Message: {user_message}
 
 Consider:
@@ -1515,7 +1564,7 @@ Provide a response that feels natural, helpful, and contextually appropriate:
 """
         
         try:
-            final_response = await get_llm_response(context_prompt, system_prompt=system_prompt)
+            final_response = await get_llm_response(context_prompt, system_prompt=system_prompt, context=context)
             return final_response.text
         except Exception as e:
             # Fallback response generation
@@ -1527,7 +1576,15 @@ Provide a response that feels natural, helpful, and contextually appropriate:
                 return "I've completed your request. Is there anything else I can help you with today?"
 
     async def _get_user_context(self, user_id: str) -> Dict[str, Any]:
-        """Get comprehensive user context"""
+        """Get comprehensive user context (cached per user for a minute)"""
+        return await self._user_context_cache.get_or_fetch(user_id, lambda: self._load_user_context(user_id))
+
+    def _invalidate_user_context(self, user_id: str):
+        """Drop cached user context after an operation that changes account data"""
+        self._user_context_cache.invalidate(user_id)
+
+    async def _load_user_context(self, user_id: str) -> Dict[str, Any]:
+        """Load user context from the backing store"""
         
         # In a real implementation, this would fetch from user database
         return {
@@ -1538,7 +1595,11 @@ Provide a response that feels natural, helpful, and contextually appropriate:
         }
 
     async def _get_user_profile(self, user_id: str) -> Dict[str, Any]:
-        """Get user profile for personalization"""
+        """Get user profile for personalization (cached per user for five minutes)"""
+        return await self._user_profile_cache.get_or_fetch(user_id, lambda: self._load_user_profile(user_id))
+
+    async def _load_user_profile(self, user_id: str) -> Dict[str, Any]:
+        """Load user profile from the backing store"""
         
         # Mock user profile - in production, fetch from database
         return {
@@ -1557,14 +1618,11 @@ Provide a response that feels natural, helpful, and contextually appropriate:
         # Update enhanced memory
         if session_id not in self.conversation_memory:
             self.conversation_memory[session_id] = {
-                'topics_discussed': [],
-                'tasks_completed': [],
+                'topics_discussed': set(),
+                'tasks_completed': set(),
                 'user_preferences': {},
-                'context_switches': []
+                'context_switches': deque(maxlen=64)
             }
         
         # Track topics and patterns
-        topics = self._extract_topics(user_message)
-        for topic in topics:
-            if topic not in self.conversation_memory[session_id]['topics_discussed']:
-                self.conversation_memory[session_id]['topics_discussed'].append(topic)
+        self.conversation_memory[session_id]['topics_discussed'].update(self._extract_topics(user_message))
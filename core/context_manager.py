@@ -1,16 +1,136 @@
-import sqlite3
 import json
+import logging
+import orjson
+import threading
+import time
 from typing import Dict, List, Tuple, Any, Optional
 from core.state_manager import StateManager
 from tools.definitions import TOOL_DEFINITIONS
 import re
 from datetime import datetime
+from functools import lru_cache
+from itertools import islice
+from types import MappingProxyType
+
+def _keyword_pattern(keywords) -> "re.Pattern[str]":
+    """Compile keywords into one alternation that matches any of them as a substring"""
+    return re.compile('|'.join(re.escape(keyword) for keyword in keywords))
+
+# Banking topics by keyword (substring matches) for stored history entries
+_TOPIC_MAP = MappingProxyType({
+    'loan': _keyword_pattern(('loan', 'borrow', 'mortgage', 'credit')),
+    'card': _keyword_pattern(('card', 'debit', 'credit', 'block')),
+    'account': _keyword_pattern(('account', 'balance', 'statement')),
+    'transfer': _keyword_pattern(('transfer', 'send', 'payment'))
+})
+_URGENT_KEYWORDS = ('urgent', 'emergency', 'lost', 'stolen', 'immediately', 'asap')
+
+# History rows are committed in batches: once this many are queued, or after this many seconds
+_HISTORY_BATCH_SIZE = 50
+_HISTORY_FLUSH_INTERVAL = 0.2
+
+logger = logging.getLogger("hsbc.context")
+
+_PROMPT_HEAD = """You are an advanced conversational banking assistant with exceptional contextual understanding.
+
+CORE INTELLIGENCE:
+• Perfect conversation memory and context retention
+• Emotional intelligence - detect user mood and urgency
+• Adaptive communication - match user's style and needs
+• Proactive assistance - anticipate user needs
+• Seamless task management - handle interruptions and context switches
+
+CURRENT CONVERSATION CONTEXT:"""
+
+_URGENCY_BLOCK = """
+⚠️  HIGH URGENCY DETECTED: {indicators}
+- Prioritize immediate assistance
+- Offer quick solutions and escalation options
+- Show empathy and understanding"""
+
+_UNCERTAINTY_BLOCK = """
+🤔 UNCERTAINTY DETECTED: {indicators}
+- Ask clarifying questions
+- Provide options and explanations
+- Guide user step-by-step"""
+
+_TOPIC_SHIFT_BLOCK = """
+🔄 TOPIC SHIFT DETECTED:
+- Acknowledge the topic change
+- Ask if user wants to complete previous task
+- Smoothly transition to new topic"""
+
+# Per-session state blocks, filled in on every call
+_LOAN_BLOCK = """
+
+📋 ACTIVE LOAN APPLICATION:
+- ID: {application_id}
+- Amount: ${amount}
+- Status: {status}
+- Next Step: {next_step}"""
+
+_SUSPENDED_BLOCK = """
+
+⏸️  SUSPENDED TASKS: {count} task(s) available to resume"""
+
+_RESPONSE_GUIDELINES = """
+
+RESPONSE GUIDELINES:
+• Match the user's communication style and emotional state
+• Provide clear, actionable responses
+• Use tools when real-time data is needed
+• Offer proactive suggestions when appropriate
+• Handle errors gracefully with alternatives"""
+
+def _history_entry(row) -> Dict[str, Any]:
+    """History dict for a (user_message, ai_response, timestamp, topics, urgency_level) row"""
+    return {
+        'user': row[0],
+        'assistant': row[1],
+        'timestamp': row[2],
+        'topics': json.loads(row[3]) if row[3] else [],
+        'urgency': row[4] or 'normal'
+    }
+
+def _format_turns(history: List[Dict], count: int):
+    """The last `count` history turns, one User/Assistant line pair each, without slicing the list"""
+    return (f"User: {turn['user']}\nAssistant: {turn['assistant']}"
+            for turn in islice(history, max(0, len(history) - count), None))
+
+@lru_cache(maxsize=512)
+def _context_prompt(urgency_indicators: Optional[Tuple[str, ...]], uncertainty_indicators: Tuple[str, ...],
+                    topic_shift: bool) -> str:
+    """System prompt head for a message context; the same context always yields the same string"""
+    parts = [_PROMPT_HEAD]
+    
+    # Add urgency handling
+    if urgency_indicators is not None:
+        parts.append(_URGENCY_BLOCK.format(indicators=', '.join(urgency_indicators)))
+    
+    # Add uncertainty handling
+    if uncertainty_indicators:
+        parts.append(_UNCERTAINTY_BLOCK.format(indicators=', '.join(uncertainty_indicators)))
+    
+    # Add topic shift handling
+    if topic_shift:
+        parts.append(_TOPIC_SHIFT_BLOCK)
+    
+    return "".join(parts)
 
 class ContextManager:
     def __init__(self, db_path: str = 'banking_agent.db'):
         self.db_path = db_path
         self.state_manager = StateManager(db_path)
+        # Share the state manager's connection (and its lock) instead of opening one per call
+        self._conn = self.state_manager._conn
+        self._lock = self.state_manager._lock
         self.context_patterns = self._initialize_context_patterns()
+        self._context_regexes = {category: _keyword_pattern(words) for category, words in self.context_patterns.items()}
+        # Queued history rows; a daemon thread commits them in batches, and reads flush first
+        self._history_rows = []
+        self._history_ready = threading.Condition()
+        self._flush_lock = threading.Lock()
+        threading.Thread(target=self._write_history_batches, name="history-writer", daemon=True).start()
 
     def _initialize_context_patterns(self) -> Dict[str, List[str]]:
         """Initialize patterns for context detection"""
@@ -24,57 +144,112 @@ class ContextManager:
 
     def get_conversation_history(self, session_id: str, limit: int = 20) -> List[Dict]:
         """Get conversation history from database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT user_message, ai_response, timestamp, topics, urgency_level
-            FROM conversation_history 
-            WHERE session_id = ? 
-            ORDER BY timestamp DESC 
-            LIMIT ?
-        ''', (session_id, limit))
-        
-        results = cursor.fetchall()
-        conn.close()
+        self.flush()
+        with self._lock:
+            cursor = self._conn.cursor()
+            
+            cursor.execute('''
+                SELECT user_message, ai_response, timestamp, topics, urgency_level
+                FROM conversation_history 
+                WHERE session_id = ? 
+                ORDER BY timestamp DESC 
+                LIMIT ?
+            ''', (session_id, limit))
+            
+            results = cursor.fetchall()
         
         # Convert to list of dicts and reverse to get chronological order
-        history = []
-        for row in reversed(results):
-            history.append({
-                'user': row[0],
-                'assistant': row[1],
-                'timestamp': row[2],
-                'topics': json.loads(row[3]) if row[3] else [],
-                'urgency': row[4] or 'normal'
-            })
+        return [_history_entry(row) for row in reversed(results)]
+
+    def _load_session(self, session_id: str, limit: int) -> Tuple[List[Dict], Optional[Dict]]:
+        """Recent history and session state for a session, read in one query"""
+        self.flush()
+        with self._lock:
+            # History rows are tagged 'H' (newest first), the state row 'S'
+            rows = self._conn.execute('''
+                SELECT * FROM (
+                    SELECT 'H', user_message, ai_response, timestamp, topics, urgency_level
+                    FROM conversation_history
+                    WHERE session_id = ?
+                    ORDER BY timestamp DESC
+                    LIMIT ?
+                )
+                UNION ALL
+                SELECT 'S', state_data, NULL, NULL, NULL, NULL
+                FROM session_state
+                WHERE session_id = ?
+            ''', (session_id, limit, session_id)).fetchall()
         
-        return history
+        history = []
+        state = None
+        for row in rows:
+            if row[0] == 'S':
+                state = json.loads(row[1])
+            else:
+                history.append(_history_entry(row[1:]))
+        history.reverse()
+        return history, state
 
     def update_history(self, session_id: str, user_message: str, ai_response: str):
         """Update conversation history in database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         # Extract topics and urgency
-        topics = self._extract_topics_from_text(user_message)
-        urgency = self._detect_urgency(user_message)
-        
-        cursor.execute('''
-            INSERT INTO conversation_history 
-            (session_id, user_message, ai_response, topics, urgency_level)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (session_id, user_message, ai_response, json.dumps(topics), urgency))
-        
-        conn.commit()
-        conn.close()
+        message_lower = user_message.lower()
+        topics = self._extract_topics_from_text(user_message, message_lower)
+        urgency = self._detect_urgency(user_message, message_lower)
+        
+        # Stamped now (UTC, like CURRENT_TIMESTAMP) since the row is written a little later
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+        with self._history_ready:
+            self._history_rows.append((session_id, user_message, ai_response, timestamp, orjson.dumps(topics).decode(), urgency))
+            self._history_ready.notify()
+
+    def flush(self):
+        """Commit all queued history rows in one transaction"""
+        # Held across the insert, so a flush that finds the queue empty still waits for an in-flight batch
+        with self._flush_lock:
+            with self._history_ready:
+                rows, self._history_rows = self._history_rows, []
+            if not rows:
+                return
+            try:
+                # Both statements commit together or roll back together
+                with self._lock, self._conn:
+                    self._conn.executemany('''
+                        INSERT INTO conversation_history 
+                        (session_id, user_message, ai_response, timestamp, topics, urgency_level)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    ''', rows)
+                    # Keep per-session topic counts in step with the history rows
+                    self._conn.executemany('''
+                        INSERT INTO session_topics (session_id, topic, mentions)
+                        SELECT ?, value, 1 FROM json_each(?) WHERE true
+                        ON CONFLICT(session_id, topic) DO UPDATE SET mentions = mentions + 1
+                    ''', [(row[0], row[4]) for row in rows])
+            except Exception:
+                # Put the batch back ahead of anything queued since, so a later flush retries it in order
+                with self._history_ready:
+                    self._history_rows[:0] = rows
+                raise
+
+    def _write_history_batches(self):
+        """Background loop committing queued history once a batch fills or the flush interval passes"""
+        while True:
+            with self._history_ready:
+                self._history_ready.wait_for(lambda: self._history_rows)
+                self._history_ready.wait_for(lambda: len(self._history_rows) >= _HISTORY_BATCH_SIZE,
+                                             timeout=_HISTORY_FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("History write failed")
+                # The batch was requeued; wait before retrying instead of spinning on a persistent error
+                time.sleep(_HISTORY_FLUSH_INTERVAL)
 
     def prepare_prompt(self, user_id: str, session_id: str, message: str) -> Tuple[str, List]:
         """Prepare enhanced prompt with context intelligence"""
         
-        # Get conversation history from database
-        history = self.get_conversation_history(session_id, limit=10)
-        current_state = self.state_manager.get_state(session_id)
+        # Get conversation history and session state from database
+        history, current_state = self._load_session(session_id, limit=10)
         
         # Analyze message context
         message_context = self._analyze_message_context(message, history)
@@ -93,7 +268,8 @@ class ContextManager:
         
         return full_prompt, TOOL_DEFINITIONS
 
-    def _analyze_message_context(self, message: str, history: List[Dict]) -> Dict[str, Any]:
+    def _analyze_message_context(self, message: str, history: List[Dict],
+                                 message_lower: Optional[str] = None) -> Dict[str, Any]:
         """Analyze message for contextual cues"""
         
         context = {
@@ -105,32 +281,30 @@ class ContextManager:
             'complexity': 'simple'
         }
         
-        message_lower = message.lower()
+        if message_lower is None:
+            message_lower = message.lower()
         
         # Detect urgency
-        urgency_matches = [word for word in self.context_patterns['urgency'] 
-                          if word in message_lower]
+        urgency_matches = self._find_indicators('urgency', message_lower)
         if urgency_matches:
             context['urgency_level'] = 'high'
             context['urgency_indicators'] = urgency_matches
         
         # Detect uncertainty
-        uncertainty_matches = [word for word in self.context_patterns['uncertainty'] 
-                              if word in message_lower]
+        uncertainty_matches = self._find_indicators('uncertainty', message_lower)
         if uncertainty_matches:
             context['uncertainty_indicators'] = uncertainty_matches
             context['emotional_state'] = 'uncertain'
         
         # Detect topic shifts
         if history and len(history) > 0:
-            last_topics = self._extract_topics_from_text(history[-1]['user'])
-            current_topics = self._extract_topics_from_text(message)
+            last_topics = history[-1]['topics']  # extracted when the turn was stored
+            current_topics = self._extract_topics_from_text(message, message_lower)
             if current_topics and last_topics and not any(t in last_topics for t in current_topics):
                 context['topic_shift'] = True
         
         # Detect continuation
-        continuation_matches = [word for word in self.context_patterns['continuation'] 
-                               if word in message_lower]
+        continuation_matches = self._find_indicators('continuation', message_lower)
         if continuation_matches:
             context['continuation_indicators'] = continuation_matches
         
@@ -140,21 +314,22 @@ class ContextManager:
         
         return context
 
-    def _extract_topics_from_text(self, text: str) -> List[str]:
+    def _find_indicators(self, category: str, message_lower: str) -> List[str]:
+        """Keywords of a context category found in the message, in pattern order"""
+        # One compiled search settles the common no-match case before any per-word checks
+        if not self._context_regexes[category].search(message_lower):
+            return []
+        return [word for word in self.context_patterns[category] if word in message_lower]
+
+    def _extract_topics_from_text(self, text: str, text_lower: Optional[str] = None) -> List[str]:
         """Extract banking topics from text"""
         
         topics = []
-        text_lower = text.lower()
+        if text_lower is None:
+            text_lower = text.lower()
         
-        topic_map = {
-            'loan': ['loan', 'borrow', 'mortgage', 'credit'],
-            'card': ['card', 'debit', 'credit', 'block'],
-            'account': ['account', 'balance', 'statement'],
-            'transfer': ['transfer', 'send', 'payment']
-        }
-        
-        for topic, keywords in topic_map.items():
-            if any(keyword in text_lower for keyword in keywords):
+        for topic, pattern in _TOPIC_MAP.items():
+            if pattern.search(text_lower):
                 topics.append(topic)
         
         return topics
@@ -163,68 +338,28 @@ class ContextManager:
                                        message_context: Dict) -> str:
         """Build context-aware system prompt"""
         
-        base_prompt = """You are an advanced conversational banking assistant with exceptional contextual understanding.
-
-CORE INTELLIGENCE:
-• Perfect conversation memory and context retention
-• Emotional intelligence - detect user mood and urgency
-• Adaptive communication - match user's style and needs
-• Proactive assistance - anticipate user needs
-• Seamless task management - handle interruptions and context switches
-
-CURRENT CONVERSATION CONTEXT:"""
-        
-        # Add urgency handling
+        urgency = None
         if message_context['urgency_level'] == 'high':
-            base_prompt += f"""
-⚠️  HIGH URGENCY DETECTED: {', '.join(message_context.get('urgency_indicators', []))}
-- Prioritize immediate assistance
-- Offer quick solutions and escalation options
-- Show empathy and understanding"""
-        
-        # Add uncertainty handling
-        if message_context['uncertainty_indicators']:
-            base_prompt += f"""
-🤔 UNCERTAINTY DETECTED: {', '.join(message_context['uncertainty_indicators'])}
-- Ask clarifying questions
-- Provide options and explanations
-- Guide user step-by-step"""
-        
-        # Add topic shift handling
-        if message_context['topic_shift']:
-            base_prompt += f"""
-🔄 TOPIC SHIFT DETECTED:
-- Acknowledge the topic change
-- Ask if user wants to complete previous task
-- Smoothly transition to new topic"""
+            urgency = tuple(message_context.get('urgency_indicators', []))
+        parts = [_context_prompt(urgency, tuple(message_context['uncertainty_indicators']),
+                                 bool(message_context['topic_shift']))]
         
         # Add state context
         if current_state:
             if current_state.get('loan_application'):
                 loan_info = current_state['loan_application']
-                base_prompt += f"""
-
-📋 ACTIVE LOAN APPLICATION:
-- ID: {loan_info.get('application_id')}
-- Amount: ${loan_info.get('amount', 'TBD')}
-- Status: {loan_info.get('status', 'In Progress')}
-- Next Step: {loan_info.get('next_step', 'Pending')}"""
+                parts.append(_LOAN_BLOCK.format(
+                    application_id=loan_info.get('application_id'),
+                    amount=loan_info.get('amount', 'TBD'),
+                    status=loan_info.get('status', 'In Progress'),
+                    next_step=loan_info.get('next_step', 'Pending')
+                ))
             
             if current_state.get('suspended_tasks'):
-                base_prompt += f"""
-
-⏸️  SUSPENDED TASKS: {len(current_state['suspended_tasks'])} task(s) available to resume"""
-        
-        base_prompt += """
-
-RESPONSE GUIDELINES:
-• Match the user's communication style and emotional state
-• Provide clear, actionable responses
-• Use tools when real-time data is needed
-• Offer proactive suggestions when appropriate
-• Handle errors gracefully with alternatives"""
+                parts.append(_SUSPENDED_BLOCK.format(count=len(current_state['suspended_tasks'])))
         
-        return base_prompt
+        parts.append(_RESPONSE_GUIDELINES)
+        return "".join(parts)
 
     def _build_intelligent_conversation_context(self, history: List[Dict], 
                                               current_message: str, 
@@ -240,9 +375,7 @@ RESPONSE GUIDELINES:
             # Show more history for complex conversations
             history_length = 8 if message_context['complexity'] == 'complex' else 5
             
-            for turn in history[-history_length:]:
-                context_parts.append(f"User: {turn['user']}")
-                context_parts.append(f"Assistant: {turn['assistant']}")
+            context_parts.extend(_format_turns(history, history_length))
         
         # Add context analysis
         if message_context['urgency_level'] == 'high':
@@ -264,14 +397,13 @@ RESPONSE GUIDELINES:
                                  tool_result: Any, user_message: str) -> str:
         """Enhanced tool result integration"""
         
-        history = self.get_conversation_history(session_id, limit=5)
-        current_state = self.state_manager.get_state(session_id)
+        history, current_state = self._load_session(session_id, limit=5)
         
         # Build enhanced prompt with tool result
         prompt_parts = [
             "TOOL EXECUTION COMPLETED:",
             f"Tool: {tool_name}",
-            f"Result: {json.dumps(tool_result, indent=2)}",
+            f"Result: {orjson.dumps(tool_result, default=str, option=orjson.OPT_NON_STR_KEYS).decode()}",
             f"User's Original Request: {user_message}",
             ""
         ]
@@ -288,9 +420,7 @@ RESPONSE GUIDELINES:
         # Add recent conversation for context
         if history:
             prompt_parts.append("RECENT CONVERSATION:")
-            for turn in history[-3:]:
-                prompt_parts.append(f"User: {turn['user']}")
-                prompt_parts.append(f"Assistant: {turn['assistant']}")
+            prompt_parts.extend(_format_turns(history, 3))
             prompt_parts.append("")
         
         prompt_parts.extend([
@@ -306,13 +436,13 @@ RESPONSE GUIDELINES:
         
         return "\n".join(prompt_parts)
 
-    def _detect_urgency(self, message: str) -> str:
+    def _detect_urgency(self, message: str, message_lower: Optional[str] = None) -> str:
         """Detect urgency level in message"""
         
-        urgent_keywords = ['urgent', 'emergency', 'lost', 'stolen', 'immediately', 'asap']
-        message_lower = message.lower()
+        if message_lower is None:
+            message_lower = message.lower()
         
-        if any(keyword in message_lower for keyword in urgent_keywords):
+        if any(keyword in message_lower for keyword in _URGENT_KEYWORDS):
             return 'high'
         elif '!' in message or message.isupper():
             return 'medium'
@@ -321,25 +451,32 @@ RESPONSE GUIDELINES:
 
     def get_conversation_statistics(self, session_id: str) -> Dict[str, Any]:
         """Get conversation statistics from database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT COUNT(*) as total_messages,
-                   AVG(CASE WHEN urgency_level = 'high' THEN 1 ELSE 0 END) as urgency_rate,
-                   GROUP_CONCAT(DISTINCT topics) as all_topics
-            FROM conversation_history 
-            WHERE session_id = ?
-        ''', (session_id,))
-        
-        result = cursor.fetchone()
-        conn.close()
+        self.flush()
+        with self._lock:
+            cursor = self._conn.cursor()
+            
+            cursor.execute('''
+                SELECT COUNT(*) as total_messages,
+                       AVG(CASE WHEN urgency_level = 'high' THEN 1 ELSE 0 END) as urgency_rate
+                FROM conversation_history 
+                WHERE session_id = ?
+            ''', (session_id,))
+            
+            result = cursor.fetchone()
+            
+            # Most discussed first
+            cursor.execute('''
+                SELECT topic FROM session_topics
+                WHERE session_id = ?
+                ORDER BY mentions DESC, topic
+            ''', (session_id,))
+            topics = [row[0] for row in cursor.fetchall()]
         
         if result:
             return {
                 'total_messages': result[0],
                 'urgency_rate': result[1] or 0,
-                'topics_discussed': result[2].split(',') if result[2] else []
+                'topics_discussed': topics
             }
         
         return {'total_messages': 0, 'urgency_rate': 0, 'topics_discussed': []}
@@ -1,67 +1,119 @@
 import sqlite3
 import json
-from typing import Dict, Optional, Any
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional, Any, TypedDict
 from datetime import datetime
 import os
 
+# INSERT ... RETURNING arrived in SQLite 3.35; older libraries read the merged row back separately
+_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+class MultiStepProcess(TypedDict, total=False):
+    """Shape of the 'multi_step_process' entry kept in session state"""
+    type: str
+    current_step: str
+    collected_data: Dict[str, Any]
+    next_step: str
+    is_new_application: bool
+    card_id: str
+
 class StateManager:
     def __init__(self, db_path: str = 'banking_agent.db'):
         self.db_path = db_path
+        # One long-lived connection, used from worker threads one at a time under the lock
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.RLock()
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute('PRAGMA cache_size=-64000')
+            self._conn.execute('PRAGMA temp_store=MEMORY')
         self._init_database()
 
     def _init_database(self):
         """Initialize SQLite database with required tables"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Create state table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS session_state (
-                session_id TEXT PRIMARY KEY,
-                state_data TEXT NOT NULL,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Create conversation history table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS conversation_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                session_id TEXT NOT NULL,
-                user_message TEXT NOT NULL,
-                ai_response TEXT NOT NULL,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                topics TEXT,
-                urgency_level TEXT DEFAULT 'normal'
-            )
-        ''')
-        
-        # Create user profiles table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_profiles (
-                user_id TEXT PRIMARY KEY,
-                profile_data TEXT NOT NULL,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
+        with self._lock:
+            cursor = self._conn.cursor()
+            
+            # Create state table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS session_state (
+                    session_id TEXT PRIMARY KEY,
+                    state_data TEXT NOT NULL,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # Create conversation history table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS conversation_history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_id TEXT NOT NULL,
+                    user_message TEXT NOT NULL,
+                    ai_response TEXT NOT NULL,
+                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    topics TEXT,
+                    urgency_level TEXT DEFAULT 'normal'
+                )
+            ''')
+            
+            # Recent-history reads (newest first per session) and age-based cleanup use these
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_hist_session_ts
+                ON conversation_history (session_id, timestamp DESC)
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_state_updated
+                ON session_state (updated_at DESC)
+            ''')
+            
+            # Per-session topic counts, maintained as history is written
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'session_topics'")
+            has_topics_table = cursor.fetchone() is not None
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS session_topics (
+                    session_id TEXT NOT NULL,
+                    topic TEXT NOT NULL,
+                    mentions INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (session_id, topic)
+                )
+            ''')
+            if not has_topics_table:
+                # Backfill from history written before the table existed
+                cursor.execute('''
+                    INSERT INTO session_topics (session_id, topic, mentions)
+                    SELECT session_id, value, COUNT(*)
+                    FROM conversation_history, json_each(conversation_history.topics)
+                    WHERE json_valid(topics)
+                    GROUP BY session_id, value
+                ''')
+            
+            # Create user profiles table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS user_profiles (
+                    user_id TEXT PRIMARY KEY,
+                    profile_data TEXT NOT NULL,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            self._conn.commit()
 
     def get_state(self, session_id: str) -> Optional[Dict[str, Any]]:
         """Get current state for a session from database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            'SELECT state_data FROM session_state WHERE session_id = ?',
-            (session_id,)
-        )
-        
-        result = cursor.fetchone()
-        conn.close()
+        with self._lock:
+            cursor = self._conn.cursor()
+            
+            cursor.execute(
+                'SELECT state_data FROM session_state WHERE session_id = ?',
+                (session_id,)
+            )
+            
+            result = cursor.fetchone()
         
         if result:
             return json.loads(result[0])
@@ -69,74 +121,102 @@ class StateManager:
 
     def update_state(self, session_id: str, new_state_data: Dict[str, Any]) -> Dict[str, Any]:
         """Update state for a session in database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Get existing state
-        existing_state = self.get_state(session_id) or {}
-        
-        # Merge with new data
-        existing_state.update(new_state_data)
-        
-        # Update or insert
-        cursor.execute('''
-            INSERT OR REPLACE INTO session_state (session_id, state_data, updated_at)
-            VALUES (?, ?, CURRENT_TIMESTAMP)
-        ''', (session_id, json.dumps(existing_state)))
-        
-        conn.commit()
-        conn.close()
-        
-        return existing_state
+        # Top-level keys are replaced like dict.update (json_patch would merge nested objects
+        # and drop None values), with the merge done inside SQLite in a single statement
+        assignments = ''.join(', ?, json(?)' for _ in new_state_data)
+        params = [session_id, json.dumps(new_state_data)]
+        for key, value in new_state_data.items():
+            # SQLite JSON paths have no escape for a quote inside a quoted label
+            if '"' in key:
+                raise ValueError(f"State key {key!r} must not contain '\"'")
+            params += ['$."%s"' % key, json.dumps(value)]
+        
+        with self._lock:
+            cursor = self._conn.cursor()
+            
+            cursor.execute('''
+                INSERT INTO session_state (session_id, state_data) VALUES (?, ?)
+                ON CONFLICT(session_id) DO UPDATE SET
+                    state_data = json_set(state_data{}), updated_at = CURRENT_TIMESTAMP
+                {}
+            '''.format(assignments, 'RETURNING state_data' if _HAS_RETURNING else ''), params)
+            if not _HAS_RETURNING:
+                cursor.execute('SELECT state_data FROM session_state WHERE session_id = ?', (session_id,))
+            merged = cursor.fetchone()[0]
+            
+            self._conn.commit()
+        
+        return json.loads(merged)
+
+    @asynccontextmanager
+    async def session(self, session_id: str, state: Optional[Dict[str, Any]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Load a session's state once for in-place edits (or reuse one already loaded this turn); on exit it is written back only if it changed"""
+        if state is None:
+            state = self.get_state(session_id) or {}
+        snapshot = json.dumps(state, sort_keys=True)
+        
+        yield state
+        
+        # Written as a whole (not merged) so keys removed inside the block stay removed; the commit
+        # runs off the event loop but is still awaited, so the next turn always sees it
+        if json.dumps(state, sort_keys=True) != snapshot:
+            await asyncio.to_thread(self.set_state, session_id, state)
 
     def clear_state(self, session_id: str):
         """Clear state for a session from database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('DELETE FROM session_state WHERE session_id = ?', (session_id,))
-        
-        conn.commit()
-        conn.close()
+        with self._lock:
+            cursor = self._conn.cursor()
+            
+            cursor.execute('DELETE FROM session_state WHERE session_id = ?', (session_id,))
+            
+            self._conn.commit()
 
     def set_state(self, session_id: str, state_data: Dict[str, Any]):
         """Set complete state for a session in database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT OR REPLACE INTO session_state (session_id, state_data, updated_at)
-            VALUES (?, ?, CURRENT_TIMESTAMP)
-        ''', (session_id, json.dumps(state_data)))
-        
-        conn.commit()
-        conn.close()
+        with self._lock:
+            cursor = self._conn.cursor()
+            
+            cursor.execute('''
+                INSERT OR REPLACE INTO session_state (session_id, state_data, updated_at)
+                VALUES (?, ?, CURRENT_TIMESTAMP)
+            ''', (session_id, json.dumps(state_data)))
+            
+            self._conn.commit()
 
     def get_all_sessions(self) -> list:
         """Get all active sessions"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT session_id, updated_at FROM session_state ORDER BY updated_at DESC')
-        results = cursor.fetchall()
-        conn.close()
+        with self._lock:
+            cursor = self._conn.cursor()
+            
+            cursor.execute('SELECT session_id, updated_at FROM session_state ORDER BY updated_at DESC')
+            results = cursor.fetchall()
         
         return [{'session_id': row[0], 'updated_at': row[1]} for row in results]
 
     def cleanup_old_sessions(self, days_old: int = 30):
         """Clean up sessions older than specified days"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            DELETE FROM session_state 
-            WHERE datetime(updated_at) < datetime('now', '-{} days')
-        '''.format(days_old))
-        
-        cursor.execute('''
-            DELETE FROM conversation_history 
-            WHERE datetime(timestamp) < datetime('now', '-{} days')
-        '''.format(days_old))
-        
-        conn.commit()
-        conn.close()
+        with self._lock:
+            # One transaction for all deletes, rolled back together if any of them fails
+            with self._conn:
+                cursor = self._conn.cursor()
+                
+                # Timestamps are stored in datetime()'s own format, so the bare columns compare directly
+                # (which lets the indexes be used)
+                cutoff = '-{} days'.format(int(days_old))
+                cursor.execute('''
+                    DELETE FROM session_state 
+                    WHERE updated_at < datetime('now', ?)
+                ''', (cutoff,))
+                
+                cursor.execute('''
+                    DELETE FROM conversation_history 
+                    WHERE timestamp < datetime('now', ?)
+                ''', (cutoff,))
+                
+                cursor.execute('''
+                    DELETE FROM session_topics
+                    WHERE session_id NOT IN (SELECT session_id FROM conversation_history)
+                ''')
+            
+            # Large deletes skew the planner's statistics; this re-analyzes only tables that need it
+            self._conn.execute('PRAGMA optimize')
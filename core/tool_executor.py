@@ -1,3 +1,4 @@
+import inspect
 from tools import banking_api, knowledge_base
 from typing import Any, Dict
 
@@ -13,20 +14,26 @@ class ToolExecutor:
             "get_loan_status": banking_api.get_loan_status,
             "retrieve_knowledge": knowledge_base.retrieve
         }
+        # name -> (function, takes user_id, accepted argument names), resolved once instead of per call
+        self._dispatch = {}
+        for name, fn in self.tool_functions.items():
+            params = inspect.signature(fn).parameters
+            self._dispatch[name] = (fn, 'user_id' in params, frozenset(params) - {'user_id'})
 
     def execute(self, user_id: str, tool_name: str, **kwargs) -> Any:
         """Execute a tool with the given arguments"""
         
-        if tool_name not in self.tool_functions:
+        entry = self._dispatch.get(tool_name)
+        if entry is None:
             return f"Error: Tool '{tool_name}' not found."
+        fn, needs_user_id, accepted = entry
         
         try:
-            # Add user_id to kwargs for all banking API calls
-            if tool_name.startswith(('get_', 'block_', 'apply_')):
-                kwargs['user_id'] = user_id
+            # Drop arguments the tool does not take; banking API calls always get the caller's user_id
+            args = {key: value for key, value in kwargs.items() if key in accepted}
+            if needs_user_id:
+                args['user_id'] = user_id
             
-            # Call the corresponding function
-            result = self.tool_functions[tool_name](**kwargs)
-            return result
+            return fn(**args)
         except Exception as e:
             return f"Error executing tool '{tool_name}': {str(e)}"
@@ -4,10 +4,30 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+try:
+    import uvloop  # noqa: F401  (not available on Windows)
+    LOOP = "uvloop"
+except ImportError:
+    LOOP = "asyncio"
+
+try:
+    import httptools  # noqa: F401
+    HTTP = "httptools"
+except ImportError:
+    HTTP = "auto"
+
 if __name__ == "__main__":
+    # Each worker is a separate process with its own startup hook and database handles.
+    # Auto-reload only works with a single worker, so it defaults on only in that case.
+    workers = int(os.getenv("WORKERS", 1))
+    reload = os.getenv("RELOAD", "true" if workers == 1 else "false").lower() == "true"
     uvicorn.run(
         "app.main:app",
         host=os.getenv("HOST", "127.0.0.1"),
         port=int(os.getenv("PORT", 8000)),
-        reload=True
+        reload=reload,
+        workers=None if reload else workers,
+        loop=LOOP,
+        http=HTTP,
+        backlog=int(os.getenv("BACKLOG", 2048))
     )
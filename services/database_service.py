@@ -1,17 +1,23 @@
 import sqlite3
 import json
+import random
 from typing import Dict, Any, Optional, List
 from datetime import datetime
 import os
 
 class DatabaseService:
-    def __init__(self, db_path: str = 'banking_agent.db'):
+    def __init__(self, db_path: str = 'banking_agent.db', timeout: float = 2.0):
         self.db_path = db_path
+        self.timeout = timeout
         self._init_database()
 
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection that gives up on a locked database after `timeout` seconds"""
+        return sqlite3.connect(self.db_path, timeout=self.timeout)
+
     def _init_database(self):
         """Initialize SQLite database with all required tables"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         # Users table
@@ -146,7 +152,7 @@ class DatabaseService:
 
     def _insert_sample_data(self):
         """Insert John Doe's sample data"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         # Insert user
@@ -207,10 +213,21 @@ class DatabaseService:
         conn.commit()
         conn.close()
 
+    def ping(self) -> bool:
+        """Run a trivial query to check the database is reachable"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT 1')
+        result = cursor.fetchone()
+        conn.close()
+        
+        return result == (1,)
+
     # User operations
     def get_user(self, user_id: str) -> Optional[Dict[str, Any]]:
         """Get user data"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         
@@ -222,7 +239,7 @@ class DatabaseService:
 
     def update_user_balance(self, user_id: str, new_balance: float, available_balance: float = None):
         """Update user account balance"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         if available_balance is None:
@@ -239,7 +256,7 @@ class DatabaseService:
     # Card operations
     def get_user_cards(self, user_id: str) -> List[Dict[str, Any]]:
         """Get all cards for a user"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         
@@ -251,7 +268,7 @@ class DatabaseService:
 
     def block_card(self, card_id: str) -> bool:
         """Block a card"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -270,7 +287,7 @@ class DatabaseService:
 
     def update_card_limit(self, card_id: str, new_limit: float, new_available_credit: float) -> bool:
         """Update card credit limit"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -286,7 +303,7 @@ class DatabaseService:
 
     def get_card(self, card_id: str) -> Optional[Dict[str, Any]]:
         """Get a specific card"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         
@@ -299,7 +316,7 @@ class DatabaseService:
     # Transaction operations
     def get_user_transactions(self, user_id: str, limit: int = 10) -> List[Dict[str, Any]]:
         """Get user transactions"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         
@@ -315,7 +332,7 @@ class DatabaseService:
 
     def add_transaction(self, user_id: str, transaction_data: Dict[str, Any]) -> str:
         """Add a new transaction"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         transaction_id = transaction_data.get('id', f"TXN{datetime.now().strftime('%Y%m%d%H%M%S')}")
@@ -338,7 +355,7 @@ class DatabaseService:
     # Loan operations
     def get_user_loans(self, user_id: str) -> List[Dict[str, Any]]:
         """Get all loan applications for a user"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         
@@ -348,9 +365,35 @@ class DatabaseService:
         
         return [dict(row) for row in results]
 
+    def get_user_bundle(self, user_id: str, transaction_limit: int = 10) -> Dict[str, Any]:
+        """Get user, cards, loans and recent transactions over one connection"""
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
+        user = cursor.fetchone()
+        cursor.execute('SELECT * FROM cards WHERE user_id = ? ORDER BY created_at', (user_id,))
+        cards = cursor.fetchall()
+        cursor.execute('SELECT * FROM loan_applications WHERE user_id = ? ORDER BY created_at DESC', (user_id,))
+        loans = cursor.fetchall()
+        cursor.execute('''
+            SELECT * FROM transactions WHERE user_id = ? 
+            ORDER BY date DESC, created_at DESC LIMIT ?
+        ''', (user_id, transaction_limit))
+        transactions = cursor.fetchall()
+        conn.close()
+        
+        return {
+            "user": dict(user) if user else None,
+            "cards": [dict(row) for row in cards],
+            "loans": [dict(row) for row in loans],
+            "recent_transactions": [dict(row) for row in transactions]
+        }
+
     def add_loan_application(self, user_id: str, loan_data: Dict[str, Any]) -> str:
         """Add a new loan application"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         application_id = loan_data['application_id']
@@ -377,7 +420,7 @@ class DatabaseService:
 
     def update_loan_status(self, application_id: str, status: str, approved_date: str = None) -> bool:
         """Update loan application status"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         if approved_date:
@@ -400,7 +443,7 @@ class DatabaseService:
     # Card application operations
     def add_card_application(self, user_id: str, card_app_data: Dict[str, Any]) -> str:
         """Add a new card application"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         application_id = card_app_data['application_id']
@@ -421,7 +464,7 @@ class DatabaseService:
 
     def get_user_card_applications(self, user_id: str) -> List[Dict[str, Any]]:
         """Get all card applications for a user"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         
@@ -432,7 +475,7 @@ class DatabaseService:
         return [dict(row) for row in results]
     def add_actual_card(self, user_id: str, card_data: Dict[str, Any]) -> str:
         """Add an actual card to the cards table (not just application)"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         card_id = card_data['card_id']
@@ -458,7 +501,6 @@ class DatabaseService:
 
     def generate_card_number(self, card_type: str, brand: str) -> Dict[str, str]:
         """Generate a random card number based on type and brand"""
-        import random
         
         # BIN (Bank Identification Number) ranges for different brands
         bin_ranges = {
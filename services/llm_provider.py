@@ -1,16 +1,38 @@
 import os
 import json
+import asyncio
 from typing import List, Dict, Optional
-from groq import Groq
+import httpx
+from groq import AsyncGroq
 from app.schemas import LLMResponse, ToolCall
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Shared connection pool so LLM calls reuse kept-alive connections across turns
+# (closed by the app's shutdown hook)
+http_client = httpx.AsyncClient(
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+    timeout=httpx.Timeout(60.0, connect=5.0)
+)
+
 # Initialize Groq client
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+client = AsyncGroq(api_key=os.getenv("GROQ_API_KEY"), http_client=http_client)
+
+# Bound on in-flight completions; bursts wait here instead of piling onto the provider.
+# Created on first use so it belongs to the server's running loop (on 3.9 a semaphore
+# binds to the loop current at construction, which is not the one uvicorn serves on)
+_llm_slots: Optional[asyncio.Semaphore] = None
+
+def _get_llm_slots() -> asyncio.Semaphore:
+    """The completion semaphore, created inside the running loop"""
+    global _llm_slots
+    if _llm_slots is None:
+        _llm_slots = asyncio.Semaphore(int(os.getenv("LLM_MAX_CONCURRENCY", 16)))
+    return _llm_slots
 
-async def get_llm_response(prompt: str, tools: List[Dict] = None, system_prompt: Optional[str] = None) -> LLMResponse:
+async def get_llm_response(prompt: str, tools: List[Dict] = None, system_prompt: Optional[str] = None,
+                           context: Optional[str] = None) -> LLMResponse:
     """Get response from Groq Llama 3.3 70B model"""
     
     try:
@@ -20,6 +42,11 @@ async def get_llm_response(prompt: str, tools: List[Dict] = None, system_prompt:
         if system_prompt:
             messages.append({"role": "system", "content": system_prompt})
         
+        # Per-turn recall goes in its own message after the system prompt, so the
+        # system prompt stays identical across turns and can be prefix-cached
+        if context:
+            messages.append({"role": "user", "content": context})
+        
         messages.append({"role": "user", "content": prompt})
         
         # Prepare the API call
@@ -37,7 +64,8 @@ async def get_llm_response(prompt: str, tools: List[Dict] = None, system_prompt:
             kwargs["tools"] = tools
             kwargs["tool_choice"] = "auto"
         
-        response = client.chat.completions.create(**kwargs)
+        async with _get_llm_slots():
+            response = await client.chat.completions.create(**kwargs)
         
         message = response.choices[0].message
         
@@ -62,12 +90,13 @@ async def get_llm_response(prompt: str, tools: List[Dict] = None, system_prompt:
         # Enhanced error handling with fallback responses
         error_msg = str(e)
         
-        # Provide contextual fallback responses based on the prompt
-        if "loan" in prompt.lower():
+        # Provide contextual fallback responses based on the prompt and recall
+        prompt_lower = f"{context}\n{prompt}".lower() if context else prompt.lower()
+        if "loan" in prompt_lower:
             fallback_text = "I'd be happy to help you with your loan inquiry. However, I'm experiencing technical difficulties accessing our loan systems right now. Please try again in a moment, or you can call our loan department at 1-800-BANK-LOAN."
-        elif "card" in prompt.lower() and "block" in prompt.lower():
+        elif "card" in prompt_lower and "block" in prompt_lower:
             fallback_text = "For immediate card blocking due to loss or theft, please call our 24/7 hotline at 1-800-BLOCK-CARD. I'm currently experiencing technical issues but your card security is our priority."
-        elif "balance" in prompt.lower() or "statement" in prompt.lower():
+        elif "balance" in prompt_lower or "statement" in prompt_lower:
             fallback_text = "I'm having trouble accessing account information right now. You can check your balance and statements through our mobile app or online banking portal. Technical support: 1-800-HELP-BANK."
         else:
             fallback_text = f"I apologize for the technical difficulty. Our banking services are temporarily affected. Please try again shortly or contact customer service at 1-800-BANK-HELP for immediate assistance."
@@ -77,10 +106,9 @@ async def get_llm_response(prompt: str, tools: List[Dict] = None, system_prompt:
             has_tool_call=False
         )
 
-def create_enhanced_system_prompt(user_context: Dict = None) -> str:
-    """Create an enhanced system prompt for banking conversations"""
-    
-    base_prompt = """You are SecureBank's intelligent conversational assistant, designed to provide exceptional banking support with human-like understanding and efficiency.
+# Kept byte-identical across turns and users so providers can cache the prompt prefix;
+# anything user- or turn-specific goes in the separate context message
+SYSTEM_PROMPT = """You are SecureBank's intelligent conversational assistant, designed to provide exceptional banking support with human-like understanding and efficiency.
 
 CORE CAPABILITIES:
 • Multi-turn conversation management with perfect context retention
@@ -127,13 +155,20 @@ PERSONALIZATION:
 • Adapt communication style to user preferences
 • Remember user's preferred interaction patterns"""
 
-    # Add user-specific context if available
+def create_enhanced_system_prompt() -> str:
+    """Create an enhanced system prompt for banking conversations"""
+    return SYSTEM_PROMPT
+
+def format_user_context(user_context: Dict = None) -> str:
+    """Format user-specific details for the context message"""
+    
+    lines = []
     if user_context:
         if user_context.get('name'):
-            base_prompt += f"\n\nUSER CONTEXT:\n• Customer Name: {user_context['name']}"
+            lines.append(f"• Customer Name: {user_context['name']}")
         if user_context.get('account_type'):
-            base_prompt += f"\n• Account Type: {user_context['account_type']}"
+            lines.append(f"• Account Type: {user_context['account_type']}")
         if user_context.get('recent_activity'):
-            base_prompt += f"\n• Recent Activity: {user_context['recent_activity']}"
+            lines.append(f"• Recent Activity: {user_context['recent_activity']}")
     
-    return base_prompt
+    return "USER CONTEXT:\n" + "\n".join(lines) if lines else ""
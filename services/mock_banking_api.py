@@ -569,7 +569,6 @@ def apply_new_card_data(user_id: str, card_type: str, brand: str) -> Dict[str, A
         card_details = db.generate_card_number(card_type_clean, brand)
         
         # Generate expiry date (3 years from now)
-        from datetime import datetime, timedelta
         expiry_date = datetime.now() + timedelta(days=365*3)
         expiry_str = expiry_date.strftime("%m/%Y")
         
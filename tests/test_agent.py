@@ -1,14 +1,18 @@
 import pytest
-from core.agent import ConversationalAgent
+import asyncio
+import sqlite3
+from core.agent import ConversationalAgent, _parse_loan_fields
 from core.state_manager import StateManager
 
 @pytest.fixture
-def agent():
+def agent(tmp_path, monkeypatch):
+    # The agent opens banking_agent.db relative to the working directory; keep it out of the repo
+    monkeypatch.chdir(tmp_path)
     return ConversationalAgent()
 
 @pytest.fixture  
-def state_manager():
-    return StateManager()
+def state_manager(tmp_path):
+    return StateManager(str(tmp_path / "test.db"))
 
 def test_agent_initialization(agent):
     assert agent.context_manager is not None
@@ -35,3 +39,62 @@ def test_state_manager_operations(state_manager):
     state_manager.clear_state(session_id)
     cleared_state = state_manager.get_state(session_id)
     assert cleared_state is None
+
+def test_state_manager_session(state_manager):
+    session_id = "test_session_scope"
+    state_manager.set_state(session_id, {"pending_action": {"tool": "block_card"}, "keep": 1})
+    
+    async def clear_pending():
+        async with state_manager.session(session_id) as state:
+            state.pop("pending_action", None)
+    
+    asyncio.run(clear_pending())
+    assert state_manager.get_state(session_id) == {"keep": 1}
+    
+    state_manager.clear_state(session_id)
+
+def test_parse_loan_fields():
+    message = "I need $15,000 for my Wedding and I earn 80000"
+    assert _parse_loan_fields(message, message.lower()) == (15000.0, 80000.0, "Wedding")
+    
+    # "card" is not the purpose keyword "car"; plurals still count
+    assert _parse_loan_fields("my card", "my card") == (None, None, None)
+    assert _parse_loan_fields("two cars", "two cars") == (None, None, "Auto Purchase")
+    
+    # A stray comma before the figure is not taken as the amount
+    assert _parse_loan_fields("Well, $5,000", "well, $5,000") == (5000.0, None, None)
+
+def test_history_batched_writes(agent):
+    session_id = "test_history_batch"
+    agent.context_manager.update_history(session_id, "my balance please", "Your balance is ₹1,000")
+    
+    # Reads flush queued rows first
+    history = agent.context_manager.get_conversation_history(session_id)
+    assert history[-1]['user'] == "my balance please"
+    assert agent.context_manager.get_conversation_statistics(session_id)['topics_discussed'] == ['account']
+
+def test_history_flush_failure_requeues(agent):
+    context_manager = agent.context_manager
+    context_manager.flush()
+    conn = context_manager._conn
+    
+    # Hold the writer off while the topic upsert (the second statement) is made to fail
+    with context_manager._flush_lock:
+        context_manager.update_history("test_flush_fail", "block my card", "Done")
+        with context_manager._lock:
+            conn.execute("ALTER TABLE session_topics RENAME TO session_topics_moved")
+            conn.commit()
+    with pytest.raises(sqlite3.OperationalError):
+        context_manager.flush()
+    
+    # Nothing half-written is left open, and the row is still queued (checked with the writer held off)
+    with context_manager._flush_lock, context_manager._lock:
+        assert not conn.in_transaction
+        assert conn.execute("SELECT COUNT(*) FROM conversation_history WHERE session_id = 'test_flush_fail'").fetchone()[0] == 0
+        assert [row[0] for row in context_manager._history_rows] == ["test_flush_fail"]
+        conn.execute("ALTER TABLE session_topics_moved RENAME TO session_topics")
+        conn.commit()
+    context_manager.flush()
+    assert context_manager.get_conversation_statistics("test_flush_fail") == {
+        'total_messages': 1, 'urgency_rate': 0, 'topics_discussed': ['card']
+    }
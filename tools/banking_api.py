@@ -11,7 +11,8 @@ from services.mock_banking_api import (
     apply_new_card_data,
     get_cards_for_limit_modification,
     get_current_limit_info,
-    modify_credit_limit_data
+    modify_credit_limit_data,
+    get_comprehensive_account_data
 )
 from typing import Dict, Any
 
@@ -84,9 +85,7 @@ def get_loan_status(user_id: str) -> Dict[str, Any]:
     return get_loan_applications_data(user_id)
 def get_user_cards_display(user_id: str) -> Dict[str, Any]:
     """Get all cards for a user for display purposes (no selection interface)"""
-    from services.mock_banking_api import get_user_cards_data
     return get_user_cards_data(user_id)
 def get_comprehensive_account_details(user_id: str) -> Dict[str, Any]:
     """Get complete account details including everything"""
-    from services.mock_banking_api import get_comprehensive_account_data
     return get_comprehensive_account_data(user_id)